@@ -0,0 +1,38 @@
+# Micro-benchmark: normalización fila a fila (apply) vs. gym_data.set_volume, que es lo que
+# usan summarize_sessions y rollup_sets en la app.
+# Uso: python benchmarks/bench_normalization.py [filas]
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gym_data  # noqa: E402
+
+def make_logs(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Peso': rng.uniform(0, 200, n_rows).round(1),
+        'Unidad': rng.choice(['Kg', 'Lbs'], n_rows, p=[0.7, 0.3]),
+        'Reps': rng.integers(1, 20, n_rows),
+    })
+
+def rowwise(df, unidad):
+    peso_norm = df.apply(lambda row: gym_data.convert_weight(float(row['Peso']), row.get('Unidad', 'Kg'), unidad), axis=1)
+    return peso_norm * df['Reps']
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = make_logs(n_rows)
+    for unidad in ("Kg", "Lbs"):
+        vol_row, t_row = timed(rowwise, df, unidad)
+        vol_vec, t_vec = timed(gym_data.set_volume, df, unidad)
+        assert np.allclose(vol_row, vol_vec)
+        print(f"{n_rows:>9,} filas -> {unidad}: apply {t_row * 1000:9.1f} ms | vectorizado {t_vec * 1000:7.1f} ms | x{t_row / t_vec:,.0f}")
@@ -0,0 +1,138 @@
+# Benchmark de las rutas de datos con un log sintético (mismo esquema que la hoja "Logs").
+# Cada etapa se mide dos veces: tiempo sin tracemalloc y pico de memoria con tracemalloc.
+# Uso: python benchmarks/bench_pipeline.py [filas ...] [--json resultados.json]
+#      (por defecto 1k, 10k, 100k y 1M sets)
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import gym_data  # noqa: E402
+import gym_mirror  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+SETS_PER_EXERCISE = 3
+EXERCISES_PER_SESSION = 4
+LOOKUPS = 1_000
+
+with open(os.path.join(ROOT, 'plantillas_rutinas.json'), 'r', encoding='utf-8') as f:
+    ROUTINES = json.load(f)
+
+def make_sheet_values(n_sets, seed=0):
+    # Filas de texto como las devuelve get_all_values(): 85% sesiones de rutina, 10% Libre,
+    # 5% logs Legacy sin ID; 70% de las sesiones en Kg
+    rng = np.random.default_rng(seed)
+    nombres = list(ROUTINES)
+    catalogo = np.array([e for r in nombres for e in ROUTINES[r]])
+    plan = np.array([[ROUTINES[r][i % len(ROUTINES[r])] for i in range(EXERCISES_PER_SESSION)] for r in nombres])
+
+    sets_por_sesion = SETS_PER_EXERCISE * EXERCISES_PER_SESSION
+    n_sesiones = -(-n_sets // sets_por_sesion)
+    tipo = rng.choice(['rutina', 'libre', 'legacy'], n_sesiones, p=[0.85, 0.10, 0.05])
+    rutina_idx = rng.integers(0, len(nombres), n_sesiones)
+    inicio = pd.Timestamp('2015-01-05 18:00') + pd.to_timedelta(np.arange(n_sesiones) * 2, unit='D') \
+        + pd.to_timedelta(rng.integers(0, 180, n_sesiones), unit='min')
+    unidad = rng.choice(['Kg', 'Lbs'], n_sesiones, p=[0.7, 0.3])
+
+    fila = np.arange(n_sets)
+    sesion = fila // sets_por_sesion
+    pos = fila % sets_por_sesion
+    ejercicio = plan[rutina_idx[sesion], pos // SETS_PER_EXERCISE]
+    libres = tipo[sesion] == 'libre'
+    ejercicio[libres] = rng.choice(catalogo, libres.sum())
+
+    fechas = pd.DatetimeIndex(inicio[sesion]) + pd.to_timedelta(pos * 3, unit='min')
+    rutina = np.array(nombres)[rutina_idx[sesion]].astype(object)
+    rutina[libres] = 'Libre'
+    rutina[tipo[sesion] == 'legacy'] = 'Legacy'
+    id_sesion = pd.DatetimeIndex(inicio).strftime('%Y%m%d%H%M%S').to_numpy()[sesion].astype(object)
+    id_sesion[libres] = 'Libre_Session'
+    id_sesion[tipo[sesion] == 'legacy'] = 'N/A'
+    peso = (rng.uniform(10, 140, n_sets) / 2.5).round() * 2.5
+    # ID_Set como lo asigna el journal; los logs Legacy no lo tienen
+    id_set = pd.Series(fila).map('s{:015x}'.format).to_numpy()
+    id_set[tipo[sesion] == 'legacy'] = ''
+
+    df = pd.DataFrame({
+        'Fecha': fechas.strftime('%Y-%m-%d %H:%M'),
+        'ID_Sesion': id_sesion,
+        'Rutina': rutina,
+        'Ejercicio': ejercicio,
+        'Set_No': pos % SETS_PER_EXERCISE + 1,
+        'Peso': peso,
+        'Unidad': unidad[sesion],
+        'Reps': rng.integers(5, 13, n_sets),
+        'Notas': '',
+        'ID_Set': id_set,
+    })
+    # Mismo orden de columnas que la hoja; una columna que falte aquí falla con KeyError
+    return gym_data.LOG_COLUMNS, df[gym_data.LOG_COLUMNS].astype(str).values.tolist()
+
+def stage_lookups(index):
+    ejercicios = [e for r in ROUTINES.values() for e in r]
+    return sum(index.get(ejercicios[i % len(ejercicios)]) is not None for i in range(LOOKUPS))
+
+def measure(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def run(n_sets):
+    header, rows = make_sheet_values(n_sets)
+    group_index = gym_data.build_muscle_group_index(ROUTINES)
+    resultados = {}
+
+    df_raw, *resultados['lectura (parse_rows)'] = measure(gym_mirror.parse_rows, header, rows)
+    del rows
+    df, *resultados['post-proceso + esquema tipado'] = measure(gym_data.normalize_logs, df_raw)
+    _, *resultados['historial (sesiones)'] = measure(gym_data.summarize_sessions, df)
+    _, *resultados['volumen semanal'] = measure(gym_data.rollup_sets, df, group_index)
+    index, *resultados['índice última sesión'] = measure(gym_data.build_last_session_index, df)
+    _, *resultados[f'{LOOKUPS} lookups'] = measure(stage_lookups, index)
+
+    rollups = gym_data.VolumeRollups()
+    rollups.rebuild(df, group_index, "v1")
+    sesion = df.tail(SETS_PER_EXERCISE * EXERCISES_PER_SESSION)
+    _, *resultados['sync incremental (apply)'] = measure(rollups.apply, sesion, "v1", "v2")
+
+    # Memoria del log en caché: tal como sale del parser frente al esquema tipado
+    memoria = {"sin tipar": frame_mb(df_raw), "tipado": frame_mb(df)}
+    return resultados, memoria
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    informe = {}
+    for n_sets in args.sizes:
+        resultados, memoria = run(n_sets)
+        informe[n_sets] = {etapa: {"ms": t * 1000, "peak_mb": peak / 2**20} for etapa, (t, peak) in resultados.items()}
+        informe[n_sets]["memoria_frame_mb"] = memoria
+        print(f"\n{n_sets:,} sets")
+        for etapa, (t, peak) in resultados.items():
+            print(f"  {etapa:<28} {t * 1000:10.1f} ms  {peak / 2**20:9.1f} MB pico")
+        print(f"  {'frame en memoria':<28} {memoria['sin tipar']:7.1f} MB sin tipar -> {memoria['tipado']:.1f} MB tipado")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
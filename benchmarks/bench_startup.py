@@ -0,0 +1,103 @@
+# Presupuesto de arranque en frío: tiempo de import de gym_app y del primer render
+# (vista Entrenamiento) con AppTest, y qué dependencias pesadas cargó el render.
+# Mide un proceso nuevo con el espejo local ya poblado (un reinicio del servidor): se
+# ejecuta en un directorio temporal con un gym_mirror.sqlite sintético.
+# Uso: python benchmarks/bench_startup.py   (sale con código 1 si se excede el presupuesto
+# o si el render cargó alguno de LAZY_MODULES; los workers "gym-*" sí pueden cargarlos)
+import ast
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Segundos; el import base de streamlit + pandas ronda 1 s en un contenedor pequeño
+IMPORT_BUDGET_SECONDS = 2.0
+FIRST_RENDER_BUDGET_SECONDS = 5.0
+
+# Módulos que solo deben cargarse al usar Food Lens / gráficos / Sheets
+# (plotly.graph_objects no aparece: lo importa el propio streamlit)
+LAZY_MODULES = ["google.generativeai", "plotly.express", "PIL.Image", "streamlit_gsheets"]
+
+def app_imports(path=os.path.join(ROOT, "gym_app.py")):
+    # Los imports de nivel de módulo de gym_app.py, en orden: la lista no se queda
+    # desfasada cuando la app añade o quita dependencias
+    modulos = []
+    for nodo in ast.parse(open(path, encoding="utf-8").read()).body:
+        if isinstance(nodo, ast.Import):
+            modulos += [alias.name for alias in nodo.names]
+        elif isinstance(nodo, ast.ImportFrom) and nodo.level == 0:
+            modulos.append(nodo.module)
+    return list(dict.fromkeys(modulos))
+
+class ImportWatcher:
+    # Finder que solo anota qué hilo importó primero cada módulo de LAZY_MODULES
+    def __init__(self):
+        self.hilos = {}
+
+    def find_spec(self, name, path=None, target=None):
+        if name in LAZY_MODULES:
+            self.hilos.setdefault(name, threading.current_thread().name)
+        return None
+
+def seed_mirror():
+    # Hojas que lee el primer render, tal como las dejaría una sesión anterior
+    import pandas as pd
+    import gym_data
+    import gym_mirror
+    ahora = datetime.now().strftime(gym_data.SHEET_DATE_FORMAT)
+    hojas = {
+        "Rutinas": pd.DataFrame({"Nombre_Rutina": ["Empuje"], "Ejercicios": ["Press Banca Plano, Fondos de Pecho"]}),
+        "Ejercicios": pd.DataFrame({"Grupo Muscular": ["Pecho", "Pecho"], "Nombre del Ejercicio": ["Press Banca Plano", "Fondos de Pecho"]}),
+        "_Borrados": pd.DataFrame(columns=["ID_Sesion", "Borrado"]),
+        "Logs": pd.DataFrame(columns=gym_data.LOG_COLUMNS),
+        f"Logs_{datetime.now().year}": pd.DataFrame([{"Fecha": ahora, "ID_Sesion": "1", "Rutina": "Empuje", "Ejercicio": "Press Banca Plano",
+                                                     "Set_No": "1", "Peso": "60", "Unidad": "Kg", "Reps": "8"}]).reindex(columns=gym_data.LOG_COLUMNS, fill_value=""),
+    }
+    for hoja, df in hojas.items():
+        gym_mirror.replace_table(hoja, df, list(df.columns), len(df), ("v1", "v1"))
+
+def timed_import():
+    start = time.perf_counter()
+    for modulo in app_imports():
+        importlib.import_module(modulo)
+    return time.perf_counter() - start
+
+def timed_first_render():
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, "gym_app.py"), default_timeout=120)
+    start = time.perf_counter()
+    at.run()
+    return time.perf_counter() - start, at
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="gym-bench-"))
+    watcher = ImportWatcher()
+    sys.meta_path.insert(0, watcher)
+    import_s = timed_import()
+    loaded_before = [m for m in LAZY_MODULES if m in sys.modules]
+    seed_mirror()
+    render_s, at = timed_first_render()
+    # Solo cuentan los imports hechos en el hilo del script (los workers no bloquean el render)
+    loaded_after = [m for m, hilo in watcher.hilos.items() if not hilo.startswith("gym-")]
+    en_segundo_plano = [f"{m} ({hilo})" for m, hilo in watcher.hilos.items() if hilo.startswith("gym-")]
+
+    print(f"import:        {import_s:6.2f} s  (presupuesto {IMPORT_BUDGET_SECONDS:.1f} s)")
+    print(f"primer render: {render_s:6.2f} s  (presupuesto {FIRST_RENDER_BUDGET_SECONDS:.1f} s)")
+    print(f"excepciones:   {[e.value for e in at.exception]}")
+    print(f"cargados tras el import: {loaded_before or '-'}")
+    print(f"cargados en el render: {loaded_after or '-'}")
+    print(f"cargados en segundo plano: {en_segundo_plano or '-'}")
+
+    ok = (import_s <= IMPORT_BUDGET_SECONDS and render_s <= FIRST_RENDER_BUDGET_SECONDS
+          and not at.exception and not loaded_after)
+    print("OK" if ok else "PRESUPUESTO EXCEDIDO" if not loaded_after else "IMPORTS DIFERIDOS CARGADOS EN EL ARRANQUE")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# Diario de comidas persistente (SQLite) y base local de alimentos.
+# Cada entrada del diario alimenta también la tabla 'alimentos', que guarda los
+# macros más recientes de cada comida y cuántas veces se ha registrado; la
+# búsqueda usa el índice sobre el nombre normalizado (prefijo), luego prefijos de
+# palabra y difflib (fuzzy).
+import difflib
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import closing
+
+FOOD_DIARY_FILE = 'food_diary.sqlite'
+SEARCH_LIMIT = 8
+FUZZY_CUTOFF = 0.6
+
+_lock = threading.Lock()
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=30)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS alimentos (
+            clave TEXT PRIMARY KEY, nombre TEXT, cal INTEGER, p INTEGER, g INTEGER, c INTEGER,
+            origen TEXT, usos INTEGER DEFAULT 0, ultimo_uso REAL);
+        CREATE TABLE IF NOT EXISTS diario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TEXT, nombre TEXT,
+            cal INTEGER, p INTEGER, g INTEGER, c INTEGER, origen TEXT, creado REAL);
+        CREATE INDEX IF NOT EXISTS diario_fecha ON diario (fecha);
+    """)
+    return closing(db)
+
+def normalize(text):
+    # Minúsculas, sin tildes y con espacios simples: "Café  con Leche" -> "cafe con leche"
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.lower().split())
+
+def _food(row):
+    return {"nombre": row[0], "cal": row[1], "p": row[2], "g": row[3], "c": row[4], "usos": row[5]}
+
+def add_entry(fecha, nombre, cal, p, g, c, origen="manual", path=FOOD_DIARY_FILE):
+    macros = (int(cal), int(p), int(g), int(c))
+    now = time.time()
+    with _lock, _connect(path) as db:
+        db.execute("INSERT INTO diario (fecha, nombre, cal, p, g, c, origen, creado) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                   (fecha, nombre, *macros, origen, now))
+        # La base de alimentos se queda con los últimos macros registrados para ese nombre
+        db.execute("""
+            INSERT INTO alimentos (clave, nombre, cal, p, g, c, origen, usos, ultimo_uso) VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (clave) DO UPDATE SET nombre = excluded.nombre, cal = excluded.cal, p = excluded.p,
+                g = excluded.g, c = excluded.c, origen = excluded.origen, usos = usos + 1, ultimo_uso = excluded.ultimo_uso
+        """, (normalize(nombre), nombre, *macros, origen, now))
+        db.commit()
+
+def entries(fecha, path=FOOD_DIARY_FILE):
+    with _connect(path) as db:
+        rows = db.execute("SELECT id, nombre, cal, p, g, c FROM diario WHERE fecha = ? ORDER BY id", (fecha,)).fetchall()
+    return [{"id": r[0], "nombre": r[1], "cal": r[2], "p": r[3], "g": r[4], "c": r[5]} for r in rows]
+
+def daily_totals(fecha, path=FOOD_DIARY_FILE):
+    with _connect(path) as db:
+        row = db.execute("SELECT COALESCE(SUM(cal), 0), COALESCE(SUM(p), 0), COALESCE(SUM(g), 0), COALESCE(SUM(c), 0) "
+                         "FROM diario WHERE fecha = ?", (fecha,)).fetchone()
+    return {"cal": row[0], "p": row[1], "g": row[2], "c": row[3]}
+
+def delete_entry(entry_id, path=FOOD_DIARY_FILE):
+    with _lock, _connect(path) as db:
+        db.execute("DELETE FROM diario WHERE id = ?", (entry_id,))
+        db.commit()
+
+def clear_day(fecha, path=FOOD_DIARY_FILE):
+    with _lock, _connect(path) as db:
+        db.execute("DELETE FROM diario WHERE fecha = ?", (fecha,))
+        db.commit()
+
+def search_foods(query, limit=SEARCH_LIMIT, path=FOOD_DIARY_FILE):
+    # Primero coincidencias por prefijo (rango sobre la clave primaria, usa el índice),
+    # después prefijos de palabra y las parecidas según difflib para cubrir erratas
+    clave = normalize(query)
+    if not clave:
+        return []
+    columnas = "nombre, cal, p, g, c, usos"
+    with _connect(path) as db:
+        rows = db.execute(f"SELECT {columnas}, clave FROM alimentos WHERE clave >= ? AND clave < ? "
+                          "ORDER BY usos DESC, ultimo_uso DESC LIMIT ?", (clave, clave + "\uffff", limit)).fetchall()
+        if len(rows) < limit:
+            vistas = {r[6] for r in rows}
+            claves = [r[0] for r in db.execute("SELECT clave FROM alimentos ORDER BY usos DESC")]
+            # "pollo" también encuentra "pechuga de pollo" (prefijo de cualquier palabra)
+            parecidas = [k for k in claves if f" {clave}" in f" {k}"]
+            parecidas += difflib.get_close_matches(clave, claves, n=limit, cutoff=FUZZY_CUTOFF)
+            # Erratas en una sola palabra ("avna" -> "avena con leche")
+            palabras = {}
+            for k in claves:
+                for palabra in k.split():
+                    palabras.setdefault(palabra, []).append(k)
+            for palabra in difflib.get_close_matches(clave, list(palabras), n=limit, cutoff=FUZZY_CUTOFF):
+                parecidas += palabras[palabra]
+            parecidas = [k for k in dict.fromkeys(parecidas) if k not in vistas]
+            for k in parecidas[:limit - len(rows)]:
+                rows.append(db.execute(f"SELECT {columnas}, clave FROM alimentos WHERE clave = ?", (k,)).fetchone())
+    return [_food(r) for r in rows]
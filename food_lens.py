@@ -0,0 +1,177 @@
+# IA Food Lens: preparación de imágenes para Gemini y caché de resultados en disco.
+# Las fotos se reducen y recodifican antes de subirlas, y el JSON de macros se
+# guarda por hash del contenido de la imagen original (LRU por fecha de acceso).
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from types import SimpleNamespace
+
+FOOD_LENS_CACHE_DIR = '.food_lens_cache'
+FOOD_LENS_CACHE_MAX_ENTRIES = 200
+MAX_IMAGE_SIDE = 1024
+JPEG_QUALITY = 85
+MACRO_KEYS = ("calories", "protein", "fats", "carbs")
+MAX_WORKERS = 4
+IMAGE_TIMEOUT_SECONDS = 60
+
+# Serializa la expulsión entre los hilos del pool; otro proceso puede borrar a la vez,
+# por eso además se toleran los ficheros que desaparecen
+_cache_lock = threading.Lock()
+
+PROMPT = """
+Eres un experto nutricionista predictivo. Analiza la imagen de esta comida.
+Identifica los alimentos presentes y trata de estimar el tamaño de la porción visualmente.
+A partir de eso, calcula los macronutrientes aproximados totales del plato.
+Tu ÚNICA salida debe ser un objeto JSON estrictamente válido, usando las siguientes claves.
+No devuelvas texto plano, ni bloques de código markdown extra (como ```json), SOLO el JSON puro:
+{
+    "food_name": "Nombre descriptivo resumido del plato (ej. Ensalada con Pollo, 2 Huevos Fritos con Pan)",
+    "calories": <número entero>,
+    "protein": <número entero gramos>,
+    "fats": <número entero gramos>,
+    "carbs": <número entero gramos>
+}
+Si la imagen no parece ser comida, devuelve 0 en los valores y "No es comida" como nombre.
+"""
+
+def image_key(raw_bytes):
+    return hashlib.sha256(raw_bytes).hexdigest()
+
+def prepare_image(raw_bytes, max_side=MAX_IMAGE_SIDE, quality=JPEG_QUALITY):
+    # JPEG acotado a max_side px (respetando la orientación EXIF de las fotos de móvil)
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(raw_bytes)))
+    image = image.convert("RGB")
+    image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def parse_response(raw_text):
+    # Limpia el markdown que el modelo a veces devuelve igualmente
+    return json.loads(raw_text.replace("```json", "").replace("```", "").strip())
+
+def normalize_result(data):
+    # JSON del modelo -> {"food_name": str, macros como int >= 0}; ValueError si no encaja
+    if not isinstance(data, dict):
+        raise ValueError(f"Respuesta del modelo no válida: {data!r}")
+    result = {"food_name": str(data.get("food_name") or "Desconocido")}
+    for clave in MACRO_KEYS:
+        valor = data.get(clave, 0)
+        try:
+            result[clave] = max(int(round(float(valor if valor is not None else 0))), 0)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Valor no numérico para '{clave}': {valor!r}") from None
+    return result
+
+def analyze_image(model, jpeg_bytes, timeout=None):
+    kwargs = {"request_options": {"timeout": timeout}} if timeout else {}
+    response = model.generate_content([PROMPT, {"mime_type": "image/jpeg", "data": jpeg_bytes}], **kwargs)
+    return normalize_result(parse_response(response.text))
+
+class StubFoodModel:
+    # Modelo local con la misma interfaz que genai.GenerativeModel, para probar sin red
+    # (FOOD_LENS_MODEL=stub). Devuelve macros deterministas derivados de la imagen.
+    def __init__(self, delay=0.5):
+        self.delay = delay
+
+    def generate_content(self, parts, request_options=None):
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and self.delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Sin respuesta tras {timeout}s")
+        time.sleep(self.delay)
+        seed = int(hashlib.sha256(parts[1]["data"]).hexdigest()[:6], 16)
+        protein, fats, carbs = 10 + seed % 40, 5 + seed % 25, 20 + seed % 80
+        return SimpleNamespace(text=json.dumps({
+            "food_name": f"Plato de prueba #{seed % 1000}",
+            "calories": protein * 4 + fats * 9 + carbs * 4,
+            "protein": protein,
+            "fats": fats,
+            "carbs": carbs,
+        }))
+
+def get_model(api_key=None):
+    if os.environ.get("FOOD_LENS_MODEL") == "stub":
+        return StubFoodModel()
+    # Import diferido: google.generativeai tarda ~1 s en cargar y solo lo usa Food Lens
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    # Use Gemini 1.5 Flash (vision capable) - standard robust model
+    return genai.GenerativeModel('gemini-1.5-flash')
+
+def analyze_cached(model, raw_bytes, timeout=None):
+    # Misma foto -> mismo hash -> resultado desde la caché local sin llamar al modelo.
+    # Las entradas antiguas sin validar que no encajen se vuelven a pedir
+    key = image_key(raw_bytes)
+    food_data = cache_get(key)
+    if food_data is not None:
+        try:
+            return normalize_result(food_data)
+        except ValueError:
+            pass
+    food_data = analyze_image(model, prepare_image(raw_bytes), timeout=timeout)
+    cache_put(key, food_data)
+    return food_data
+
+def analyze_images(model, images, max_workers=MAX_WORKERS, timeout=IMAGE_TIMEOUT_SECONDS):
+    # images: [(nombre, bytes)]. Genera (nombre, food_data, error) a medida que cada imagen
+    # termina; el pool está acotado y cada petición lleva su propio timeout.
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="food-lens")
+    futures = {executor.submit(analyze_cached, model, raw, timeout): nombre for nombre, raw in images}
+    # Margen global por si el cliente ignora el timeout de la petición
+    rondas = -(-len(futures) // max_workers)
+    try:
+        for future in as_completed(futures, timeout=timeout * (rondas + 1)):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    except FuturesTimeoutError:
+        for future, nombre in futures.items():
+            if not future.done():
+                yield nombre, None, TimeoutError(f"Sin respuesta tras {timeout}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}.json")
+
+def cache_get(key, cache_dir=FOOD_LENS_CACHE_DIR):
+    path = _cache_path(key, cache_dir)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        os.utime(path) # Marca el acceso para la expulsión LRU
+    except (OSError, ValueError):
+        return None
+    return data
+
+def _mtime_or_zero(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+def cache_put(key, data, cache_dir=FOOD_LENS_CACHE_DIR, max_entries=FOOD_LENS_CACHE_MAX_ENTRIES):
+    os.makedirs(cache_dir, exist_ok=True)
+    # .tmp propio de cada hilo: dos análisis de la misma foto pueden guardar a la vez
+    tmp_path = f"{_cache_path(key, cache_dir)}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, _cache_path(key, cache_dir))
+
+    with _cache_lock:
+        entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".json")]
+        if len(entries) > max_entries:
+            entries.sort(key=_mtime_or_zero)
+            for path in entries[:len(entries) - max_entries]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -1,19 +1,54 @@
 import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 import os
-import plotly.express as px
-import plotly.graph_objects as go
-import google.generativeai as genai
-from PIL import Image
+import functools
 import json
-from streamlit_gsheets import GSheetsConnection
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import food_diary
+import food_lens
+import gym_body_comp
+import gym_data
+import gym_journal
+import gym_mirror
+import gym_perf
+import gym_sheets
 
 # --- Configuration ---
+# Los workers en segundo plano registran sus errores aquí (no pueden usar st.*)
+logger = logging.getLogger("gym_app")
+
 # Local settings file
 CONFIG_FILE = 'config.json'
-BODY_COMP_CSV_FILE = 'body_comp_log.csv'
+BODY_COMP_CSV_FILE = gym_body_comp.BODY_COMP_FILE
+BODY_COMP_WORKSHEET = "ComposicionCorporal"
+LOG_COLUMNS = gym_data.LOG_COLUMNS
+# Los sets nuevos se guardan en una hoja por año ("Logs_2026"); "Logs" queda como
+# partición histórica de antes del particionado
+LEGACY_LOGS_WORKSHEET = "Logs"
+LOG_PARTITION_PREFIX = "Logs_"
+RECENT_LOG_YEARS = 2
+# Rangos del selector de fechas (semanas hacia atrás; None = todo el historial)
+LOG_RANGES = {"Últimas 4 semanas": 4, "Últimas 12 semanas": 12, "Último año": 52, "Todo": None}
+DEFAULT_LOG_RANGE = "Últimas 12 semanas"
+LOG_PARTITION_CACHE_ENTRIES = 32
+# Borrado lógico de sesiones: lápidas en "_Borrados" que se compactan de vez en cuando
+TOMBSTONES_WORKSHEET = "_Borrados"
+TOMBSTONES_COLUMNS = ["ID_Sesion", "Borrado"]
+TOMBSTONE_COMPACT_MIN = 10
+TOMBSTONE_MAX_AGE_DAYS = 7
+LEGACY_BACKUP_FILE = 'backup.csv'
+JOURNAL_BATCH_SIZE = 200
+SYNC_RETRY_SECONDS = 30
+JOURNAL_ERROR_NOTE = "Los sets quedaron en el journal local y se reintentarán automáticamente."
+MIRROR_MAX_AGE_SECONDS = 3600
+MIRROR_FULL_REFRESH_SECONDS = 6 * 3600
 USER_PROFILE = {
     "name": "Usuario",
     "age": 30,
@@ -29,24 +64,242 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Instrumentación de este rerun (ver gym_perf): la sesión se identifica con un token propio
+st.session_state.setdefault("perf_session", f"{time.time_ns():x}")
+perf_run = gym_perf.start_run(st.session_state.perf_session, st.session_state.get("perf_run"))
+st.session_state.perf_run = perf_run
+gym_perf.phase("arranque")
+
 # --- Configurar Conexión a Google Sheets ---
-try:
-    conn = st.connection("gsheets", type=GSheetsConnection)
-except Exception as e:
-    st.error("⚠️ Es necesario configurar las credenciales de Google Sheets en Streamlit Cloud para continuar. Configura st.secrets['connections']['gsheets']")
-    st.stop()
+def open_sheets_connection():
+    # Import y conexión diferidos al primer acceso real a Sheets: streamlit_gsheets
+    # (gspread, google-auth) es lo más pesado del arranque y el espejo local puede
+    # servir las primeras lecturas sin tocar la red
+    from streamlit_gsheets import GSheetsConnection
+    try:
+        return st.connection("gsheets", type=GSheetsConnection)
+    except Exception:
+        # En un worker (sondeo de versiones, journal) no hay script en el que pintar nada:
+        # la excepción sube y la registra quien lo llamó
+        if get_script_run_ctx() is None:
+            raise
+        st.error("⚠️ Es necesario configurar las credenciales de Google Sheets en Streamlit Cloud para continuar. Configura st.secrets['connections']['gsheets']")
+        st.stop()
+
+@st.cache_resource
+def get_sheets_client():
+    # Un único limitador por servidor: todas las sesiones comparten la cuota de la API
+    return gym_sheets.SheetsClient(open_sheets_connection)
+
+sheets = get_sheets_client()
+
+def write_worksheet(worksheet_name, df):
+    # Reescritura completa de la hoja; la crea si todavía no existe
+    try:
+        sheets.update(worksheet_name, df)
+    except Exception as e:
+        if not gym_sheets.is_missing_worksheet(e):
+            raise
+        sheets.create(worksheet_name, df)
+    gym_mirror.invalidate(worksheet_name)
+    bump_version(worksheet_name, rewrite=True)
 
 def safe_gsheets_update(worksheet_name, df):
     try:
-        conn.update(worksheet=worksheet_name, data=df)
+        write_worksheet(worksheet_name, df)
+        return True
     except Exception as e:
-        if "UnsupportedOperationError" in str(type(e).__name__) or "WorksheetNotFound" in str(type(e).__name__):
-            conn.create(worksheet=worksheet_name, data=df)
-        else:
-            try:
-                conn.create(worksheet=worksheet_name, data=df)
-            except Exception:
-                pass
+        st.error(f"❌ No se pudo guardar '{worksheet_name}' en Google Sheets: {str(e)}")
+        return False
+
+# --- Versiones de las hojas ---
+# La hoja "_Versiones" guarda para cada hoja un token 'Version', que cambia en cada
+# escritura, y 'Base', que solo cambia en las reescrituras completas. Las cachés se
+# indexan por versión: se reutilizan hasta que los datos cambian de verdad, también
+# cuando escribe otro dispositivo, y cada escritura solo invalida su propia hoja.
+VERSIONS_WORKSHEET = "_Versiones"
+VERSIONS_COLUMNS = ["Hoja", "Version", "Base"]
+VERSION_CHECK_SECONDS = 30
+VERSIONED_CACHE_ENTRIES = 4
+
+@st.cache_resource
+def get_version_state():
+    # Compartido por todas las sesiones: como mucho una lectura de "_Versiones" cada VERSION_CHECK_SECONDS.
+    # 'loaded' pasa a True con la primera lectura completa; 'worksheets' es la lista de hojas
+    # del documento leída en la misma comprobación (None si el cliente no puede listarlas)
+    return {"versions": {}, "worksheets": None, "checked_at": 0.0, "loaded": False, "future": None,
+            "worksheet": None, "lock": threading.Lock()}
+
+@st.cache_resource
+def get_version_executor():
+    # La lectura de "_Versiones" (y la conexión a Sheets, si es la primera) va en su propio
+    # hilo: nunca retrasa un rerun ni espera detrás de una sincronización larga
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="gym-versions")
+
+def _versions_worksheet(estado):
+    if estado["worksheet"] is None:
+        try:
+            estado["worksheet"] = sheets.worksheet(VERSIONS_WORKSHEET)
+        except Exception as e:
+            if not gym_sheets.is_missing_worksheet(e):
+                raise
+            sheets.create(VERSIONS_WORKSHEET, pd.DataFrame(columns=VERSIONS_COLUMNS))
+            estado["worksheet"] = sheets.worksheet(VERSIONS_WORKSHEET)
+    return estado["worksheet"]
+
+def _poll_sheet_versions():
+    estado = get_version_state()
+    with estado["lock"]:
+        try:
+            worksheet = _versions_worksheet(estado)
+            if worksheet is not None:
+                values = sheets.call("read", worksheet.get_all_values, cost=1)
+                estado["versions"] = {r[0]: (r[1], r[2]) for r in values[1:] if len(r) >= 3 and r[0]}
+                estado["worksheets"] = sheets.worksheet_titles()
+            estado["loaded"] = True
+        except Exception:
+            # Se conservan las versiones conocidas y se reintenta en la próxima comprobación
+            # (sin st.*: este hilo no tiene contexto de script)
+            logger.warning("No se pudieron leer las versiones de las hojas", exc_info=True)
+            estado["worksheet"] = None
+
+def submit_version_poll():
+    # Se llama al final del rerun; los lectores usan las versiones de la última lectura
+    estado = get_version_state()
+    future = estado["future"]
+    if time.time() - estado["checked_at"] < VERSION_CHECK_SECONDS or (future is not None and not future.done()):
+        return
+    estado["checked_at"] = time.time()
+    estado["future"] = get_version_executor().submit(_poll_sheet_versions)
+
+def load_sheet_versions():
+    return get_version_state()["versions"]
+
+def sheet_version(worksheet_name):
+    estado = get_version_state()
+    version = estado["versions"].get(worksheet_name)
+    if version is None and not estado["loaded"]:
+        # Arranque en frío: hasta la primera lectura de "_Versiones" se da por buena la
+        # versión con la que se guardó el espejo local (se sirve sin tocar Sheets)
+        meta = gym_mirror.get_meta(worksheet_name)
+        if meta is not None and meta["version"] is not None:
+            return meta["version"]
+    if version is None:
+        # Hoja sin versión (cliente público o nunca escrita desde la app): caducidad por tiempo
+        return (f"t{int(time.time() // MIRROR_MAX_AGE_SECONDS)}", "t")
+    return version
+
+def bump_version(worksheet_name, rewrite=False):
+    token = f"{time.time_ns():x}"
+    estado = get_version_state()
+    with estado["lock"]:
+        base = estado["versions"].get(worksheet_name, (None, None))[1]
+        nueva = (token, token if rewrite or base is None else base)
+        # Este servidor ve su propia escritura al instante (también una hoja recién creada);
+        # el resto al leer "_Versiones"
+        estado["versions"][worksheet_name] = nueva
+        if estado["worksheets"] is not None and worksheet_name not in estado["worksheets"]:
+            estado["worksheets"] = estado["worksheets"] + [worksheet_name]
+        try:
+            worksheet = _versions_worksheet(estado)
+            if worksheet is None:
+                return
+            hojas = sheets.call("read", worksheet.col_values, 1, cost=1)
+            fila = hojas.index(worksheet_name) + 1 if worksheet_name in hojas else max(len(hojas), 1) + 1
+            sheets.call("update", worksheet.update, f"A{fila}:C{fila}", [[worksheet_name, *nueva]], cost=1)
+        except Exception:
+            # La escritura de datos ya se hizo; los demás dispositivos la verán al caducar su espejo
+            estado["worksheet"] = None
+
+def por_version(*worksheet_names):
+    # load_x(*args) llama a la función cacheada con la versión actual de sus hojas como clave;
+    # un callable en lugar de un nombre recibe los mismos args y devuelve una lista de hojas
+    # (p.ej. las particiones de Logs que cubren un rango de fechas)
+    def decorator(cached_fn):
+        @functools.wraps(cached_fn)
+        def wrapper(*args):
+            names = [n for item in worksheet_names for n in (item(*args) if callable(item) else [item])]
+            return cached_fn(tuple((name, sheet_version(name)) for name in names), *args)
+        wrapper.clear = cached_fn.clear
+        return wrapper
+    return decorator
+
+def _mirror_values(worksheet_name, values, version):
+    # Refresco completo del espejo a partir de get_all_values()
+    if not values:
+        gym_mirror.invalidate(worksheet_name)
+        return pd.DataFrame()
+    header, filas = values[0], len(values) - 1
+    with gym_perf.span("parse_rows", hoja=worksheet_name, filas=filas):
+        df = gym_mirror.parse_rows(header, values[1:])
+    gym_mirror.replace_table(worksheet_name, df, header, filas, version)
+    return df
+
+def _refresh_mirror(worksheet_name, version):
+    worksheet = sheets.worksheet(worksheet_name)
+    if worksheet is None:
+        df = sheets.read(worksheet_name)
+        gym_mirror.replace_table(worksheet_name, df, [str(c) for c in df.columns], len(df), version)
+        return df
+    return _mirror_values(worksheet_name, sheets.call("read", worksheet.get_all_values, cost=1), version)
+
+def read_sheet_rows(worksheet_name):
+    # Lectura directa de Sheets para las reescrituras completas: sin espejo ni cachés, sin
+    # ocultar errores (una hoja que falta lanza la excepción de gspread) y con las celdas
+    # tal cual están en la hoja, como texto. De paso deja el espejo al día.
+    worksheet = sheets.worksheet(worksheet_name)
+    if worksheet is None:
+        df = sheets.read(worksheet_name)
+        return df.astype(object).where(df.notna(), '').astype(str)
+    values = sheets.call("read", worksheet.get_all_values, cost=1)
+    _mirror_values(worksheet_name, values, sheet_version(worksheet_name))
+    if not values:
+        return pd.DataFrame()
+    width = len(values[0])
+    rows = [(list(r) + [''] * width)[:width] for r in values[1:]]
+    return pd.DataFrame(rows, columns=values[0], dtype=object)
+
+def ensure_sheet_unchanged(worksheet_name, leidas):
+    # Justo antes de una reescritura completa: si la hoja ya no tiene exactamente las filas
+    # leídas (p.ej. otro dispositivo acaba de añadir un set) se aborta en lugar de borrarlas
+    actuales = read_sheet_rows(worksheet_name)
+    if len(actuales) != len(leidas) or not actuales.equals(leidas):
+        raise gym_sheets.SheetChangedError(
+            f"La hoja '{worksheet_name}' cambió durante la reescritura ({len(leidas)} -> {len(actuales)} filas); se reintentará")
+
+def _fetch_mirror_tail(worksheet_name, meta, version):
+    # Solo las filas posteriores a las que ya tiene el espejo; False si no es posible
+    worksheet = sheets.worksheet(worksheet_name)
+    if worksheet is None:
+        return False
+    start_row = meta["filas"] + 2  # +1 cabecera, +1 primera fila nueva
+    rows = []
+    if start_row <= worksheet.row_count:
+        rows = sheets.call("read", worksheet.get, f"{start_row}:{worksheet.row_count}", cost=1)
+    gym_mirror.append_table(worksheet_name, gym_mirror.parse_rows(meta["cabecera"], rows), len(rows), version)
+    return True
+
+def read_worksheet(worksheet_name, incremental=False):
+    # Lectura a través del espejo SQLite local. Si la versión de la hoja no cambió se sirve
+    # el espejo sin tocar Sheets; si cambió, las hojas pequeñas se refrescan completas y las
+    # incrementales (Logs) solo piden las filas nuevas mientras no haya habido reescrituras.
+    version = sheet_version(worksheet_name)
+    meta = gym_mirror.get_meta(worksheet_name)
+    max_age = MIRROR_FULL_REFRESH_SECONDS if incremental else MIRROR_MAX_AGE_SECONDS
+    try:
+        if meta is not None and time.time() - meta["synced_at"] < max_age:
+            if meta["version"] == version:
+                with gym_perf.span("espejo.lectura", hoja=worksheet_name):
+                    return gym_mirror.read_table(worksheet_name)
+            misma_base = meta["version"] is not None and meta["version"][1] == version[1]
+            if incremental and misma_base and _fetch_mirror_tail(worksheet_name, meta, version):
+                return gym_mirror.read_table(worksheet_name)
+        return _refresh_mirror(worksheet_name, version)
+    except Exception:
+        # Sin acceso a Sheets (p.ej. 429) se sirve la última copia local si existe
+        if meta is not None:
+            return gym_mirror.read_table(worksheet_name)
+        raise
 
 # --- Helpers de Configuración Local ---
 def load_config():
@@ -62,15 +315,6 @@ def save_config(config_dict):
 APP_CONFIG = load_config()
 UNIDAD_GLOBAL = APP_CONFIG.get("unidad_preferida", "Kg")
 
-def convert_weight(weight, from_unit, to_unit):
-    if from_unit == to_unit:
-        return weight
-    if from_unit == "Kg" and to_unit == "Lbs":
-        return weight * 2.20462
-    if from_unit == "Lbs" and to_unit == "Kg":
-        return weight / 2.20462
-    return weight
-
 DEFAULT_EXERCISES = {
     "Pecho": [
         "Press Banca Plano", "Press Banca Inclinado", "Press Banca Declinado",
@@ -106,15 +350,18 @@ DEFAULT_EXERCISES = {
 }
 
 def initialize_data():
-    if "routines" not in st.session_state:
+    # Se recargan cuando cambia la versión de sus hojas (p.ej. editadas desde otro dispositivo)
+    versiones = (sheet_version("Rutinas"), sheet_version("Ejercicios"))
+    if st.session_state.get("data_versions") != versiones:
         st.session_state.routines = load_routines()
-    if "exercises" not in st.session_state:
         st.session_state.exercises = load_exercises()
+        st.session_state.data_versions = versiones
         
-@st.cache_data(ttl=3600, show_spinner=False)
-def load_routines():
+@por_version("Rutinas")
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_routines(versiones):
     try:
-        df = conn.read(worksheet="Rutinas", ttl=3600)
+        df = read_worksheet("Rutinas")
         df = df.dropna(how="all")
         routines = {}
         if not df.empty and 'Nombre_Rutina' in df.columns and 'Ejercicios' in df.columns:
@@ -127,10 +374,11 @@ def load_routines():
         pass
     return {}
 
-@st.cache_data(ttl=3600, show_spinner=False)
-def load_exercises():
+@por_version("Ejercicios")
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_exercises(versiones):
     try:
-        df = conn.read(worksheet="Ejercicios", ttl=3600)
+        df = read_worksheet("Ejercicios")
         df = df.dropna(how="all")
         catalog = {}
         if not df.empty and 'Grupo Muscular' in df.columns and 'Nombre del Ejercicio' in df.columns:
@@ -142,13 +390,12 @@ def load_exercises():
         
     return {k: sorted(v) for k, v in DEFAULT_EXERCISES.items()}
 
-def invalidate_caches():
-    load_routines.clear()
-    load_exercises.clear()
-    
-def invalidate_logs_cache():
-    load_data.clear()
-    
+@por_version("Ejercicios")
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_muscle_group_index(versiones):
+    # Se reconstruye cada vez que cambia el catálogo de ejercicios
+    return gym_data.build_muscle_group_index(load_exercises())
+
 def save_new_exercise(nombre, grupo):
     df_new = pd.DataFrame([{"Nombre del Ejercicio": nombre, "Grupo Muscular": grupo}])
     try:
@@ -162,7 +409,6 @@ def save_new_exercise(nombre, grupo):
     df = df.drop_duplicates(subset=["Nombre del Ejercicio"])
     safe_gsheets_update("Ejercicios", df)
     # Update memory
-    invalidate_caches()
     st.session_state.exercises = load_exercises()
 
 def save_routine_template(nombre, ejercicios):
@@ -188,7 +434,6 @@ def save_routine_template(nombre, ejercicios):
     updated_data = pd.concat([existing_data, new_data], ignore_index=True).reset_index(drop=True)
     safe_gsheets_update("Rutinas", updated_data)
     # Update memory
-    invalidate_caches()
     st.session_state.routines = load_routines()
 
 def delete_routine_template(nombre):
@@ -205,7 +450,6 @@ def delete_routine_template(nombre):
             updated_data = pd.DataFrame(columns=['Nombre_Rutina', 'Ejercicios', 'Fecha_Creacion'])
         safe_gsheets_update("Rutinas", updated_data)
         # Update memory
-        invalidate_caches()
         st.session_state.routines = load_routines()
         return True
     return False
@@ -215,98 +459,773 @@ initialize_data()
 EXERCISE_CATALOG = st.session_state.exercises
 
 # --- Data Persistence ---
-@st.cache_data(ttl=3600, show_spinner=False)
-def load_data():
+def log_partitions():
+    # Manifiesto de particiones: las hojas "Logs_AAAA" que existen en el documento según la
+    # última comprobación de versiones (no depende de que "_Versiones" registrara la hoja).
+    # Hasta esa primera comprobación, las que tenga el espejo local; un cliente que no puede
+    # listar hojas usa además "_Versiones" y siempre incluye la hoja histórica.
+    estado = get_version_state()
+    if estado["worksheets"] is not None:
+        nombres = set(estado["worksheets"])
+        historica = LEGACY_LOGS_WORKSHEET in nombres
+    else:
+        nombres = set(estado["versions"]) | set(gym_mirror.list_tables())
+        historica = estado["loaded"] or LEGACY_LOGS_WORKSHEET in nombres
+    return _partitions_in(nombres, historica)
+
+def _partitions_in(nombres, historica):
+    anuales = sorted(n for n in nombres if re.fullmatch(rf"{LOG_PARTITION_PREFIX}\d{{4}}", n))
+    return ([LEGACY_LOGS_WORKSHEET] if historica else []) + anuales
+
+def fresh_log_partitions():
+    # Manifiesto para las reescrituras (compactación, borrado físico): la lista de hojas se
+    # pide a Sheets en ese momento; una partición que faltara dejaría lápidas sin aplicar
+    titulos = sheets.worksheet_titles()
+    if titulos is None:
+        return log_partitions()
+    return _partitions_in(set(titulos), LEGACY_LOGS_WORKSHEET in titulos)
+
+def recent_log_partitions():
+    # Las vistas de datos recientes solo leen los últimos RECENT_LOG_YEARS años
+    # (más la hoja histórica, que queda vacía tras particionarla)
+    desde = datetime.now().year - RECENT_LOG_YEARS + 1
+    return [p for p in log_partitions() if p == LEGACY_LOGS_WORKSHEET or int(p[-4:]) >= desde]
+
+def range_start(semanas):
+    # Límite inferior del rango como 'AAAA-MM-DD' (día completo: clave de caché estable)
+    if semanas is None:
+        return None
+    return (datetime.now() - timedelta(weeks=semanas)).strftime('%Y-%m-%d')
+
+def partitions_since(desde=None):
+    if desde is None:
+        return log_partitions()
+    return [p for p in log_partitions() if p == LEGACY_LOGS_WORKSHEET or int(p[-4:]) >= int(desde[:4])]
+
+def log_partition_names(fechas):
+    # Partición de cada set según el año de su fecha (año actual si no se puede leer)
+    # (mismo parser que los lectores: pd.to_datetime a secas infiere un único formato)
+    years = gym_data.parse_dates(pd.Series(fechas)).dt.year.fillna(datetime.now().year)
+    return LOG_PARTITION_PREFIX + years.astype(int).astype(str)
+
+def load_log_partition(worksheet_name):
+    # Sin las sesiones con lápida todavía no compactadas; la clave incluye las lápidas
+    # vigentes para que un borrado no tenga que esperar a que cambie la partición
+    borrados = tuple(sorted(load_tombstones().items()))
+    return _load_log_partition(worksheet_name, sheet_version(worksheet_name), borrados)
+
+def load_logs(partitions):
+    return gym_data.concat_logs([load_log_partition(p) for p in partitions])
+
+@gym_perf.cached(st.cache_data(max_entries=LOG_PARTITION_CACHE_ENTRIES, show_spinner=False))
+def _load_log_partition(worksheet_name, version, borrados):
+    # normalize_logs deja el frame en el esquema tipado (gym_data.apply_log_schema): las
+    # fechas se parsean una vez por versión de la partición
     try:
-        df = conn.read(worksheet="Logs", ttl=3600)
-        df = df.dropna(how="all")
-        if df.empty:
-            return pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
-            
-        # Legacy mappings
-        if 'Rutina' not in df.columns and 'Rutina_Nombre' in df.columns:
-            df = df.rename(columns={'Rutina_Nombre': 'Rutina'})
-        elif 'Rutina' not in df.columns:
-            df['Rutina'] = 'Legacy'
-            
-        if 'Set_No' not in df.columns:
-            df['Set_No'] = 1
-            
-        if 'ID_Sesion' not in df.columns:
-            df['ID_Sesion'] = 'N/A'
-        if 'Unidad' not in df.columns:
-            df['Unidad'] = 'Kg'
-        if 'Notes' in df.columns:
-            df = df.rename(columns={'Notes': 'Notas'})
+        df = gym_data.normalize_logs(read_worksheet(worksheet_name, incremental=True))
+        df = gym_data.drop_tombstoned(df, dict(borrados))
+        return df if not df.empty else gym_data.empty_logs()
+    except Exception:
+        return gym_data.empty_logs()
+
+@por_version(log_partitions, TOMBSTONES_WORKSHEET)
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_data(versiones):
+    return load_logs(log_partitions())
+
+@por_version(recent_log_partitions, TOMBSTONES_WORKSHEET)
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_last_session_index(versiones):
+    # Se construye una vez por versión de los datos y se reutiliza en cada rerun;
+    # solo mira las particiones recientes
+    return gym_data.build_last_session_index(load_logs(recent_log_partitions()))
+
+@por_version(partitions_since, TOMBSTONES_WORKSHEET)
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_logs_since(versiones, desde=None):
+    # El rango se baja hasta las particiones: solo se leen las de los años que lo cubren.
+    # Cada una se normaliza entera (una vez por versión, en la caché de _load_log_partition)
+    # y las filas anteriores se descartan después, sobre el frame ya tipado, antes de agregar
+    df = load_logs(partitions_since(desde))
+    if desde is None or df.empty:
         return df
+    return df[df['Fecha'] >= pd.Timestamp(desde)].reset_index(drop=True)
+
+@por_version(partitions_since, TOMBSTONES_WORKSHEET)
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_session_summary(versiones, desde=None):
+    df_sesiones = gym_data.summarize_sessions(load_logs_since(desde))
+    df_sesiones['Etiqueta'] = df_sesiones['Fecha'].dt.strftime('%Y-%m-%d %H:%M') + " | " + df_sesiones['Rutina'].astype(str)
+    return df_sesiones
+
+@st.cache_resource
+def get_volume_rollups():
+    return gym_data.VolumeRollups()
+
+def volume_rollups_key():
+    # Versiones de todas las particiones y de las lápidas: cualquier escritura (de este u
+    # otro dispositivo, también un borrado o una compactación) deja las tablas desfasadas
+    return tuple((name, sheet_version(name)) for name in log_partitions() + [TOMBSTONES_WORKSHEET])
+
+def load_volume_rollups(desde=None):
+    # Las tablas semanales/por sesión solo se recalculan completas si el log cambió
+    # por otra vía; las sincronizaciones propias las actualizan con apply(). Un rango
+    # solo recorta las tablas materializadas, nunca vuelve a agregar los sets.
+    group_index = load_muscle_group_index()
+    rollups = get_volume_rollups()
+    with rollups.lock:
+        key = volume_rollups_key()
+        if not rollups.is_current(key, group_index):
+            rollups.rebuild(load_data(), group_index, key)
+        weekly, by_routine = rollups.weekly.copy(), rollups.by_routine.copy()
+    if desde is not None:
+        return gym_data.rollups_since(weekly, by_routine, desde)
+    return weekly, by_routine
+
+# --- Composición corporal ---
+# CSV local de solo-añadir (gym_body_comp) cacheado por mtime/tamaño; opcionalmente cada
+# medición se copia también a la hoja "ComposicionCorporal" para que sobreviva a un
+# redespliegue del contenedor, y desde ella se restaura si falta el CSV local.
+def body_comp_sync_enabled():
+    return APP_CONFIG.get("sync_composicion", True)
+
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def _load_body_comp(stamp):
+    return gym_body_comp.read(BODY_COMP_CSV_FILE)
+
+def restore_body_comp():
+    # Un intento por sesión: si la hoja no existe no se vuelve a preguntar en cada rerun
+    if st.session_state.get("composicion_restaurada"):
+        return
+    st.session_state.composicion_restaurada = True
+    try:
+        _restore_body_comp_from_sheets()
     except Exception:
-        return pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
+        return
+
+def _restore_body_comp_from_sheets():
+    # replace_all normaliza Fecha a ISO: la hoja puede devolverla con formato local
+    df = read_worksheet(BODY_COMP_WORKSHEET).dropna(how="all")
+    if not df.empty and gym_body_comp.stamp(BODY_COMP_CSV_FILE) is None:
+        gym_body_comp.replace_all(df, BODY_COMP_CSV_FILE)
 
 def load_body_comp_data():
-    if os.path.exists(BODY_COMP_CSV_FILE):
-        return pd.read_csv(BODY_COMP_CSV_FILE)
-    else:
-        return pd.DataFrame(columns=["Fecha", "Peso", "Grasa_pct", "FFMI"])
+    if body_comp_sync_enabled() and gym_body_comp.stamp(BODY_COMP_CSV_FILE) is None:
+        restore_body_comp()
+    return _load_body_comp(gym_body_comp.stamp(BODY_COMP_CSV_FILE))
 
-def delete_workout(index):
+def upload_body_comp():
+    # Fusiona el historial local con las filas que ya tiene la hoja (el mismo día gana la
+    # medición local) en lugar de sustituirlas; crea la hoja si no existe
     try:
-        existing_data = load_data()
-        if index in existing_data.index:
-            updated_data = existing_data.drop(index).reset_index(drop=True)
-            if updated_data.empty:
-                updated_data = pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
-            safe_gsheets_update("Logs", updated_data)
-            invalidate_logs_cache()
-            return True
-    except Exception:
-        pass
-    return False
+        leidas = read_sheet_rows(BODY_COMP_WORKSHEET)
+    except Exception as e:
+        if not gym_sheets.is_missing_worksheet(e):
+            raise
+        leidas = None
+    remotas = pd.DataFrame(columns=gym_body_comp.BODY_COMP_COLUMNS)
+    if leidas is not None and not leidas.empty:
+        remotas = leidas.reindex(columns=gym_body_comp.BODY_COMP_COLUMNS, fill_value='')
+        remotas = remotas[(remotas != '').any(axis=1)]
+    local = gym_body_comp.read(BODY_COMP_CSV_FILE)
+    fusion = gym_body_comp.dedupe(pd.concat([remotas, local], ignore_index=True))
+    if leidas is not None:
+        ensure_sheet_unchanged(BODY_COMP_WORKSHEET, leidas)
+    write_worksheet(BODY_COMP_WORKSHEET, fusion)
 
-# Function save_workout and save_routine deprecated in favor of batch memory sync
+def _append_body_comp_to_sheets(row):
+    try:
+        worksheet = sheets.worksheet(BODY_COMP_WORKSHEET)
+    except Exception as e:
+        if not gym_sheets.is_missing_worksheet(e):
+            raise
+        worksheet = None
+    if worksheet is None:
+        upload_body_comp()
+        return
+    # La hoja también es de solo-añadir: los duplicados del mismo día se resuelven al leer.
+    # RAW: Sheets no debe convertir la fecha ISO en una fecha con formato local
+    sheets.call("append", worksheet.append_rows, [row], value_input_option="RAW", cost=1)
+    bump_version(BODY_COMP_WORKSHEET)
 
 def save_body_comp(peso, grasa_pct, ffmi):
-    df = load_body_comp_data()
-    new_entry = {
-        "Fecha": datetime.now().strftime("%Y-%m-%d"),
-        "Peso": peso,
-        "Grasa_pct": grasa_pct,
-        "FFMI": ffmi
-    }
-    df = pd.concat([df, pd.DataFrame([new_entry])], ignore_index=True)
-    # Remove older duplicates for the same day to keep history clean (1 record per day max)
-    df = df.drop_duplicates(subset=['Fecha'], keep='last')
-    df.to_csv(BODY_COMP_CSV_FILE, index=False)
+    row = [datetime.now().strftime(gym_body_comp.BODY_COMP_DATE_FORMAT), peso, grasa_pct, ffmi]
+    if body_comp_sync_enabled() and gym_body_comp.stamp(BODY_COMP_CSV_FILE) is None:
+        # Primera medición en un contenedor nuevo: el historial de Sheets se trae antes de
+        # que el append cree el CSV (después ya no se restauraría)
+        try:
+            _restore_body_comp_from_sheets()
+        except Exception:
+            pass
+    gym_body_comp.append(*row, path=BODY_COMP_CSV_FILE)
+    if body_comp_sync_enabled():
+        try:
+            _append_body_comp_to_sheets(row)
+        except Exception as e:
+            st.warning(f"⚠️ Medición guardada localmente, pero no se pudo copiar a Google Sheets: {str(e)}")
     return True
 
-# --- UI Components ---
+# --- Figuras de Progreso Visual (cacheadas) ---
+# Cada figura se construye una vez por (versión de los datos, unidad[, rutina]); los
+# reruns solo serializan el objeto ya construido. cache_resource devuelve el mismo
+# Figure sin copiarlo: st.plotly_chart no lo modifica.
+FIGURE_CACHE_MAX_ENTRIES = 16
 
-with st.sidebar:
-    st.header("⚙️ Opciones")
-    st.write("Exporta un respaldo de tus datos.")
+def data_version(df):
+    # Hash del contenido (índice incluido); las tablas graficadas son pequeñas
+    return int(pd.util.hash_pandas_object(df).sum())
+
+@gym_perf.cached(st.cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES, show_spinner=False))
+def build_body_comp_figure(version, unidad, _df_comp):
+    # plotly se importa al construir la primera figura, no al arrancar
+    import plotly.graph_objects as go
+    # Sort by date
+    df_comp = _df_comp.assign(Fecha=gym_data.parse_dates(_df_comp['Fecha'])).sort_values(by='Fecha')
     
+    # Create figure with secondary y-axis
+    fig_comp = go.Figure()
+    
+    # Add Peso trace (primary Y)
+    fig_comp.add_trace(go.Scatter(
+        x=df_comp['Fecha'], y=df_comp['Peso'],
+        name='Peso (kg)',
+        mode='lines+markers',
+        line=dict(color='#00FFFF', width=3),
+        marker=dict(size=8, color='#00FFFF', line=dict(width=1, color='#0E1117'))
+    ))
+    
+    # Add Grasa trace (secondary Y)
+    fig_comp.add_trace(go.Scatter(
+        x=df_comp['Fecha'], y=df_comp['Grasa_pct'],
+        name='% Grasa',
+        mode='lines+markers',
+        yaxis='y2',
+        line=dict(color='#39FF14', width=3, dash='dot'),
+        marker=dict(size=8, color='#39FF14', line=dict(width=1, color='#0E1117'))
+    ))
+    
+    # Update layout for secondary Y-axis and mobile responsiveness
+    fig_comp.update_layout(
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color="#E0E0CE")),
+        margin=dict(l=0, r=0, t=30, b=0),
+        yaxis=dict(title=f'Peso ({unidad})', title_font=dict(color='#00FFFF'), tickfont=dict(color='#00FFFF'), gridcolor='#1A1D24'),
+        yaxis2=dict(title='% Grasa', title_font=dict(color='#39FF14'), tickfont=dict(color='#39FF14'), anchor='x', overlaying='y', side='right', gridcolor='#1A1D24'),
+        xaxis=dict(gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig_comp
+
+@gym_perf.cached(st.cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES, show_spinner=False))
+def build_weekly_volume_figure(version, unidad, _weekly_rollup):
+    import plotly.express as px
+    columna_volumen = 'Volumen_Lbs' if unidad == "Lbs" else 'Volumen_Kg'
+    df_grouped = _weekly_rollup[columna_volumen].rename('Volumen').reset_index()
+    
+    cyan_neon_palette = ['#00FFFF', '#39FF14', '#FF00FF', '#FFFF00', '#FF3914', '#9D00FF']
+    fig_vol = px.bar(
+        df_grouped, 
+        x="Semana", 
+        y="Volumen", 
+        color="Grupo Muscular",
+        title="Volumen (Peso x Reps)",
+        barmode='stack', # Stacked is usually better to see total weekly volume
+        color_discrete_sequence=cyan_neon_palette
+    )
+    
+    fig_vol.update_layout(
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color="#E0E0CE")),
+        margin=dict(l=0, r=0, t=30, b=0),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(title="", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
+        yaxis=dict(title=f"Volumen ({unidad})", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
+        title_font=dict(color="#E0E0CE")
+    )
+    
+    # Reduce brightness of bars a bit to fit dark theme, or add borders
+    fig_vol.update_traces(marker_line_width=1, marker_line_color='#0E1117')
+    return fig_vol
+
+@gym_perf.cached(st.cache_resource(max_entries=FIGURE_CACHE_MAX_ENTRIES, show_spinner=False))
+def build_routine_volume_figure(version, unidad, rutina, _routine_rollup):
+    import plotly.express as px
+    columna_volumen = 'Volumen_Lbs' if unidad == "Lbs" else 'Volumen_Kg'
+    volumen_por_sesion = _routine_rollup.loc[rutina, columna_volumen].rename('Volumen').reset_index()
+    
+    fig_rutina = px.line(
+        volumen_por_sesion, 
+        x='Día', 
+        y='Volumen',
+        title=f"Volumen Total Levantado: {rutina}",
+        markers=True
+    )
+    
+    fig_rutina.update_traces(line=dict(color='#FF00FF', width=3), marker=dict(size=8, color='#FF00FF', line=dict(width=1, color='#0E1117')))
+    fig_rutina.update_layout(
+        margin=dict(l=0, r=0, t=40, b=0),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(title="", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
+        yaxis=dict(title=f"Volumen ({unidad})", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
+        title_font=dict(color="#E0E0CE")
+    )
+    return fig_rutina
+
+# Vista previa de Food Lens por hash de la foto: los reruns no vuelven a recodificarla
+FOOD_PREVIEW_CACHE_ENTRIES = 8
+
+@gym_perf.cached(st.cache_data(max_entries=FOOD_PREVIEW_CACHE_ENTRIES, show_spinner=False))
+def load_food_preview(key, _raw_bytes):
+    return food_lens.prepare_image(_raw_bytes)
+
+# --- Borrado de sesiones (lápidas) ---
+# Borrar una sesión añade una fila (ID_Sesion, instante) a "_Borrados" y los lectores
+# ocultan sus sets; compact_tombstones() hace el borrado físico en el worker cuando se
+# acumulan lápidas o la más antigua caduca, reescribiendo solo las particiones afectadas.
+@por_version(TOMBSTONES_WORKSHEET)
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def load_tombstones(versiones):
+    # {ID_Sesion: instante del borrado}; si un ID se borró varias veces vale el último
     try:
-        df_logs = load_data()
-        if not df_logs.empty:
-            csv_logs = df_logs.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Exportar Entrenamientos (CSV)",
-                data=csv_logs,
-                file_name="training_log.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
+        df = read_worksheet(TOMBSTONES_WORKSHEET).dropna(how="all")
     except Exception:
-        pass
+        return {}
+    return tombstones_from_frame(df)
+
+def tombstones_from_frame(df):
+    if df.empty or not set(TOMBSTONES_COLUMNS) <= set(df.columns):
+        return {}
+    borrados = {}
+    for id_sesion, borrado in zip(df['ID_Sesion'], pd.to_datetime(df['Borrado'], errors='coerce')):
+        if pd.notna(borrado):
+            clave = gym_journal.norm_key_part(id_sesion)
+            borrados[clave] = max(borrado, borrados.get(clave, borrado))
+    return borrados
+
+def _tombstones_worksheet():
+    try:
+        return sheets.worksheet(TOMBSTONES_WORKSHEET)
+    except Exception as e:
+        if not gym_sheets.is_missing_worksheet(e):
+            raise
+        sheets.create(TOMBSTONES_WORKSHEET, pd.DataFrame(columns=TOMBSTONES_COLUMNS))
+        return sheets.worksheet(TOMBSTONES_WORKSHEET)
+
+def delete_session(id_sesion):
+    try:
+        worksheet = _tombstones_worksheet()
+        if worksheet is None:
+            # Cliente sin acceso a worksheets (no puede añadir filas): borrado físico directo
+            return _delete_session_rows(id_sesion)
+        lapida = [gym_journal.norm_key_part(id_sesion), datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
+        # RAW: Sheets no debe convertir el ID en número ni el instante en fecha local
+        sheets.call("append", worksheet.append_rows, [lapida], value_input_option="RAW", cost=1)
+        bump_version(TOMBSTONES_WORKSHEET)
+        return True
+    except Exception as e:
+        st.error(f"❌ No se pudo eliminar la sesión: {str(e)}")
+        return False
+
+def tombstones_need_compaction():
+    borrados = load_tombstones()
+    if not borrados:
+        return False
+    caducadas = min(borrados.values()) < datetime.now() - timedelta(days=TOMBSTONE_MAX_AGE_DAYS)
+    return len(borrados) >= TOMBSTONE_COMPACT_MIN or caducadas
+
+def compact_tombstones():
+    # Devuelve los sets eliminados físicamente. Todo se lee de Sheets en ese momento (nunca
+    # del espejo) y cada hoja se reescribe con sus celdas tal cual, solo si no cambió desde
+    # la lectura. "_Borrados" se comprueba justo antes de vaciarla: si un borrado añadió una
+    # lápida durante la compactación se aborta y esa lápida se aplica en la siguiente. Si se
+    # corta a mitad, repetirla es seguro (una lápida ya aplicada no oculta nada)
+    try:
+        df_lapidas = read_sheet_rows(TOMBSTONES_WORKSHEET)
+        borrados = tombstones_from_frame(df_lapidas)
+    except Exception as e:
+        if not gym_sheets.is_missing_worksheet(e):
+            raise
+        return 0
+    if not borrados:
+        return 0
+    eliminados = 0
+    hojas = fresh_log_partitions()
+    for n, hoja in enumerate(hojas, start=1):
+        report_progress(f"Compactando borrados: {hoja} ({n}/{len(hojas)})")
+        try:
+            leidas = read_sheet_rows(hoja)
+        except Exception as e:
+            # La partición histórica "Logs" puede no existir
+            if not gym_sheets.is_missing_worksheet(e):
+                raise
+            continue
+        df = _log_rows(leidas).reset_index(drop=True)
+        if df.empty:
+            continue
+        # La vista tipada solo decide qué filas se borran; se escriben las de texto
+        ocultas = gym_data.tombstoned(gym_data.apply_log_schema(df), borrados).to_numpy()
+        if ocultas.any():
+            rewrite_logs(hoja, df[~ocultas], leidas)
+            eliminados += int(ocultas.sum())
+    claves = df_lapidas['ID_Sesion'].map(gym_journal.norm_key_part)
+    instantes = pd.to_datetime(df_lapidas['Borrado'], errors='coerce')
+    pendientes = [clave not in borrados or not instante <= borrados[clave] for clave, instante in zip(claves, instantes)]
+    ensure_sheet_unchanged(TOMBSTONES_WORKSHEET, df_lapidas)
+    write_worksheet(TOMBSTONES_WORKSHEET, df_lapidas[pendientes].reset_index(drop=True))
+    return eliminados
+
+def _delete_session_rows(id_sesion):
+    # Solo se reescriben las particiones que contienen la sesión, leídas de Sheets en ese
+    # momento; los errores llegan a delete_session
+    clave = gym_journal.norm_key_part(id_sesion)
+    for hoja in fresh_log_partitions():
+        try:
+            leidas = read_sheet_rows(hoja)
+        except Exception as e:
+            if not gym_sheets.is_missing_worksheet(e):
+                raise
+            continue
+        df = _log_rows(leidas)
+        de_la_sesion = (df['ID_Sesion'].map(gym_journal.norm_key_part) == clave).to_numpy()
+        if de_la_sesion.any():
+            rewrite_logs(hoja, df[~de_la_sesion], leidas)
+    return True
+
+# Function save_workout and save_routine deprecated in favor of batch memory sync
+
+@por_version(lambda worksheet_name: [worksheet_name])
+@gym_perf.cached(st.cache_data(max_entries=VERSIONED_CACHE_ENTRIES, show_spinner=False))
+def get_logs_header(versiones, worksheet_name):
+    # La validación del esquema (fila 1) se hace una vez por versión de la hoja: una
+    # reescritura (particionado, write_worksheet) cambia la versión y la vuelve a leer
+    worksheet = sheets.worksheet(worksheet_name)
+    return sheets.call("read", worksheet.row_values, 1, cost=1) if worksheet is not None else []
+
+def rewrite_logs(worksheet_name, updated_data, leidas=None):
+    # updated_data son filas de texto (read_sheet_rows + sets del journal), nunca el frame
+    # tipado: así no se pierden formatos de fecha ni se reinterpretan celdas. leidas: filas
+    # de las que sale updated_data; se comprueba que la hoja no cambió antes de sobrescribirla
+    if leidas is not None:
+        ensure_sheet_unchanged(worksheet_name, leidas)
+    write_worksheet(worksheet_name, updated_data)
+
+def _sets_already_in(new_data_df, ids_en_hoja):
+    # Máscara de los sets cuyo ID_Set ya está en la hoja: un append que llegó a aplicarse
+    # pero no se confirmó en el journal (corte, timeout) no se vuelve a enviar
+    en_hoja = {gym_journal.norm_key_part(i) for i in ids_en_hoja} - {''}
+    return new_data_df['ID_Set'].map(gym_journal.norm_key_part).isin(en_hoja).to_numpy()
+
+def _add_set_id_header(worksheet, worksheet_name):
+    # Partición anterior a la columna ID_Set: basta con añadir su celda de cabecera
+    celda = f"{chr(ord('A') + len(LOG_COLUMNS) - 1)}1"
+    sheets.call("update", worksheet.update, celda, [[LOG_COLUMNS[-1]]], cost=1)
+    bump_version(worksheet_name, rewrite=True)
+
+def _append_to_partition(worksheet_name, new_data_df):
+    # Delta sync: solo se envían los sets nuevos. La reescritura completa queda
+    # como fallback cuando la hoja no existe o su cabecera no coincide con LOG_COLUMNS.
+    # Devuelve cuántos sets ya estaban en la hoja (leída en ese momento) y no se enviaron
+    faltante = False
+    try:
+        worksheet = sheets.worksheet(worksheet_name)
+    except Exception as e:
+        if not gym_sheets.is_missing_worksheet(e):
+            raise
+        worksheet, faltante = None, True
         
-    if os.path.exists(BODY_COMP_CSV_FILE):
-        with open(BODY_COMP_CSV_FILE, "rb") as f:
-            st.download_button(
-                label="📥 Exportar Composición Corporal (CSV)",
-                data=f,
-                file_name="body_comp_log.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
+    header = get_logs_header(worksheet_name) if worksheet is not None else []
+    if header == LOG_COLUMNS[:-1]:
+        _add_set_id_header(worksheet, worksheet_name)
+        header = get_logs_header(worksheet_name)
+    if worksheet is not None and header[:len(LOG_COLUMNS)] == LOG_COLUMNS:
+        ids_en_hoja = sheets.call("read", worksheet.col_values, LOG_COLUMNS.index('ID_Set') + 1, cost=1)[1:]
+        ya_subidos = _sets_already_in(new_data_df, ids_en_hoja)
+        nuevas = new_data_df[~ya_subidos]
+        if not nuevas.empty:
+            rows = nuevas.astype(object).where(nuevas.notna(), '').values.tolist()
+            sheets.call("append", worksheet.append_rows, rows, value_input_option="USER_ENTERED", cost=1)
+        if not nuevas.empty or ya_subidos.any():
+            # También si solo había sets ya subidos: ese append nunca llegó a cambiar la versión
+            bump_version(worksheet_name)
+        return int(ya_subidos.sum())
+        
+    # Las filas existentes se leen de Sheets en ese momento (no del espejo ni de la caché)
+    # y se reescriben como texto, tal cual estaban
+    leidas = None
+    if faltante:
+        existing_data = pd.DataFrame(columns=LOG_COLUMNS)
+    else:
+        leidas = read_sheet_rows(worksheet_name)
+        existing_data = gym_data.map_legacy_columns(leidas.copy())
+    for col in LOG_COLUMNS:
+        if col not in existing_data.columns:
+            existing_data[col] = ''
+    extra_cols = [c for c in existing_data.columns if c not in LOG_COLUMNS]
+    existing_data = existing_data[LOG_COLUMNS + extra_cols]
+    ya_subidos = _sets_already_in(new_data_df, existing_data['ID_Set'])
+    rewrite_logs(worksheet_name, pd.concat([existing_data, new_data_df[~ya_subidos]], ignore_index=True).reset_index(drop=True), leidas)
+    return int(ya_subidos.sum())
+
+def append_logs(new_data_df):
+    # Cada set va a la partición de su año ("Logs_2026"); se crea si todavía no existe.
+    # Devuelve las particiones escritas en las que todos los sets eran nuevos: solo en
+    # esas se pueden actualizar las tablas de volumen en sitio
+    new_data_df = new_data_df.reindex(columns=LOG_COLUMNS, fill_value='')
+    escritas = []
+    for worksheet_name, df_part in new_data_df.groupby(log_partition_names(new_data_df['Fecha']), sort=True):
+        if _append_to_partition(worksheet_name, df_part) == 0:
+            escritas.append(worksheet_name)
+    return escritas
+
+def _log_rows(leidas):
+    # Filas de texto de read_sheet_rows() con las columnas actuales, sin las filas vacías
+    if leidas is None or leidas.empty:
+        return pd.DataFrame(columns=LOG_COLUMNS)
+    df = gym_data.map_legacy_columns(leidas[(leidas != '').any(axis=1)].copy())
+    return df.reindex(columns=LOG_COLUMNS + [c for c in df.columns if c not in LOG_COLUMNS], fill_value='')
+
+def partition_legacy_logs():
+    # Reparte la hoja histórica "Logs" en particiones anuales y la deja solo con la cabecera.
+    # Lee de Sheets en ese momento (sin espejo ni caché; los errores se propagan) y copia las
+    # celdas tal cual. Si se corta a mitad, repetirla no duplica: de cada set solo se añaden
+    # las copias que todavía no estén en su partición (sets idénticos se conservan todos).
+    leidas = read_sheet_rows(LEGACY_LOGS_WORKSHEET)
+    df_legacy = _log_rows(leidas)
+    if df_legacy.empty:
+        return 0
+    grupos = list(df_legacy.groupby(log_partition_names(df_legacy['Fecha']), sort=True))
+    for n, (worksheet_name, df_part) in enumerate(grupos, start=1):
+        report_progress(f"Particionando historial: {worksheet_name} ({n}/{len(grupos)})")
+        try:
+            destino = read_sheet_rows(worksheet_name)
+        except Exception as e:
+            if not gym_sheets.is_missing_worksheet(e):
+                raise
+            destino = None
+        df_destino = _log_rows(destino)
+        nuevas = gym_data.rows_not_in(df_part, df_destino, ['Fecha', 'ID_Sesion', 'Ejercicio', 'Set_No'])
+        if not nuevas.empty:
+            rewrite_logs(worksheet_name, pd.concat([df_destino, nuevas], ignore_index=True), destino)
+    rewrite_logs(LEGACY_LOGS_WORKSHEET, pd.DataFrame(columns=LOG_COLUMNS), leidas)
+    return len(df_legacy)
+
+# --- Journal local de sincronización ---
+@st.cache_resource
+def get_sync_state():
+    # Compartido por todas las sesiones del servidor: la cuota de Sheets es global
+    return {"retry_at": 0.0, "last_error": None, "future": None, "lock": threading.Lock(),
+            "compaction": None, "compact_retry_at": 0.0, "partition": None, "progress": None}
+
+def report_progress(texto):
+    # Lo escribe el worker durante las tareas largas; render_sync_status lo muestra
+    get_sync_state()["progress"] = texto
+
+@st.cache_resource
+def get_sync_executor():
+    # Un único worker por servidor: las descargas del journal se serializan y cada
+    # una sube los sets pendientes de todas las sesiones
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="gym-sync")
+
+def import_legacy_backup():
+    # backup.csv (fallback previo al journal) nunca se reenviaba a Sheets
+    if os.path.exists(LEGACY_BACKUP_FILE):
+        df_backup = pd.read_csv(LEGACY_BACKUP_FILE).reindex(columns=LOG_COLUMNS, fill_value='')
+        gym_journal.append_sets(df_backup.to_dict('records'))
+        os.replace(LEGACY_BACKUP_FILE, LEGACY_BACKUP_FILE + '.importado')
+
+def drain_journal():
+    # Los sets que ya estuvieran en la hoja (corte entre append y ack) los detecta
+    # _append_to_partition por su ID_Set y se confirman sin volver a subirlos
+    pendientes = gym_journal.pending_sets()
+    if not pendientes:
+        return 0
+    sincronizados = 0
+    try:
+        for start in range(0, len(pendientes), JOURNAL_BATCH_SIZE):
+            batch = pendientes[start:start + JOURNAL_BATCH_SIZE]
+            batch_df = pd.DataFrame([row for _, row in batch])
+            antes = volume_rollups_key()
+            escritas = append_logs(batch_df)
+            gym_journal.ack([set_id for set_id, _ in batch])
+            # Las tablas solo se actualizan en sitio si lo único que cambió fueron las
+            # particiones que acaba de escribir este lote
+            despues = volume_rollups_key()
+            cambiadas = set(despues) - set(antes)
+            rollups = get_volume_rollups()
+            with rollups.lock:
+                if {name for name, _ in cambiadas} <= set(escritas):
+                    rollups.apply(gym_data.apply_log_schema(batch_df), antes, despues)
+            sincronizados += len(batch)
+    finally:
+        if sincronizados:
+            gym_journal.compact()
+    return sincronizados
+
+def try_drain_journal():
+    # Reintento automático con espera tras un 429 u otro error de la API
+    estado = get_sync_state()
+    if time.time() < estado["retry_at"]:
+        return 0
+    try:
+        sincronizados = drain_journal()
+        estado["last_error"] = None
+        return sincronizados
+    except Exception as e:
+        estado["retry_at"] = time.time() + SYNC_RETRY_SECONDS
+        estado["last_error"] = e
+        return 0
+
+def _background_drain():
+    sincronizados = try_drain_journal()
+    return sincronizados, get_sync_state()["last_error"]
+
+def submit_journal_drain():
+    estado = get_sync_state()
+    with estado["lock"]:
+        future = estado["future"]
+        if future is not None and not future.running() and not future.done():
+            return future # Ya hay una descarga en cola que recogerá los sets nuevos
+        estado["future"] = get_sync_executor().submit(_background_drain)
+        return estado["future"]
+
+def _background_compaction():
+    try:
+        return compact_tombstones(), None
+    except Exception as e:
+        get_sync_state()["compact_retry_at"] = time.time() + SYNC_RETRY_SECONDS
+        return 0, e
+    finally:
+        report_progress(None)
+
+def submit_tombstone_compaction():
+    # En el mismo worker que el journal: los appends y las reescrituras no se solapan
+    estado = get_sync_state()
+    with estado["lock"]:
+        if estado["compaction"] is None or estado["compaction"].done():
+            estado["compaction"] = get_sync_executor().submit(_background_compaction)
+        return estado["compaction"]
+
+def _background_partition():
+    try:
+        return partition_legacy_logs(), None
+    except Exception as e:
+        return 0, e
+    finally:
+        report_progress(None)
+
+def submit_legacy_partition():
+    # Con la cuota de 60 peticiones/minuto mover el historial puede pasar del minuto: corre
+    # en el worker (detrás de las subidas pendientes) y no bloquea el rerun
+    estado = get_sync_state()
+    with estado["lock"]:
+        if estado["partition"] is None or estado["partition"].done():
+            estado["partition"] = get_sync_executor().submit(_background_partition)
+        return estado["partition"]
+
+def background_work_running():
+    estado = get_sync_state()
+    return any(f is not None and not f.done() for f in (estado["future"], estado["compaction"], estado["partition"]))
+
+def sync_sets(rows, success_msg):
+    # Los sets se hacen durables en el journal y la subida a Sheets corre en segundo plano
+    gym_journal.append_sets(rows)
+    st.session_state.setdefault("sync_jobs", []).append((submit_journal_drain(), success_msg, JOURNAL_ERROR_NOTE))
+    st.info("📝 Sets guardados localmente. Sincronizando con Google Sheets en segundo plano...")
+
+def render_sync_status():
+    # Notifica los trabajos de esta sesión que ya terminaron. Cada trabajo es
+    # (future, mensaje de éxito con {n} = filas procesadas, nota para los errores)
+    jobs = st.session_state.get("sync_jobs", [])
+    for job in [j for j in jobs if j[0].done()]:
+        jobs.remove(job)
+        future, success_msg, error_note = job
+        procesados, last_error = future.result()
+        if last_error is None:
+            st.toast(success_msg.replace("{n}", str(procesados)), icon="🎉")
+        elif gym_sheets.is_quota_error(last_error):
+            st.toast(f"⚠️ Google Sheets está saturado (Error 429). {error_note}")
+        else:
+            st.toast(f"❌ Error Técnico al Sincronizar: {str(last_error)}. {error_note}")
+            
+    sets_pendientes = gym_journal.pending_count()
+    st.metric("Sets pendientes de sincronizar", sets_pendientes)
+    estado = get_sync_state()
+    if estado["progress"]:
+        st.caption(f"🔄 {estado['progress']}")
+    if estado["future"] is not None and not estado["future"].done():
+        st.caption("🔄 Sincronizando en segundo plano...")
+    elif sets_pendientes and st.button("🔄 Sincronizar ahora", use_container_width=True):
+        estado["retry_at"] = 0.0
+        st.session_state.setdefault("sync_jobs", []).append((submit_journal_drain(), "✅ Sets pendientes sincronizados.", JOURNAL_ERROR_NOTE))
+        st.rerun(scope="fragment")
+
+def render_backup_export():
+    # Los CSV se generan solo al pulsar el botón (leer todas las particiones cuesta segundos);
+    # como fragmento, el clic no vuelve a ejecutar la vista activa
+    if st.button("📦 Preparar respaldo", use_container_width=True):
+        respaldo = {"generado": datetime.now().strftime("%H:%M")}
+        try:
+            df_logs = load_data()
+            if not df_logs.empty:
+                respaldo["training_log.csv"] = gym_data.to_sheet_frame(df_logs).to_csv(index=False).encode('utf-8')
+        except Exception as e:
+            st.error(f"❌ No se pudieron leer los entrenamientos: {str(e)}")
+        df_comp_export = load_body_comp_data()
+        if not df_comp_export.empty:
+            respaldo["body_comp_log.csv"] = df_comp_export.to_csv(index=False).encode('utf-8')
+        st.session_state.respaldo = respaldo
+    respaldo = st.session_state.get("respaldo")
+    if respaldo is None:
+        return
+    st.caption(f"Respaldo generado a las {respaldo['generado']}")
+    etiquetas = {"training_log.csv": "📥 Exportar Entrenamientos (CSV)",
+                 "body_comp_log.csv": "📥 Exportar Composición Corporal (CSV)"}
+    for file_name, label in etiquetas.items():
+        if file_name in respaldo:
+            st.download_button(label=label, data=respaldo[file_name], file_name=file_name, mime="text/csv",
+                               on_click="ignore", use_container_width=True)
+
+# --- UI Components ---
+
+# Replay automático del journal (en el worker) en cuanto haya cuota disponible
+import_legacy_backup()
+if gym_journal.pending_count() and time.time() >= get_sync_state()["retry_at"]:
+    submit_journal_drain()
+if time.time() >= get_sync_state()["compact_retry_at"] and tombstones_need_compaction():
+    submit_tombstone_compaction()
+
+gym_perf.phase("sidebar")
+with st.sidebar:
+    st.header("⚙️ Opciones")
+    
+    # Mientras haya trabajo en curso el panel se refresca solo cada 2 s
+    sync_en_curso = bool(st.session_state.get("sync_jobs")) or gym_journal.pending_count() > 0 or background_work_running()
+    st.fragment(run_every=2 if sync_en_curso else None)(render_sync_status)()
+    
+    with st.expander("📊 Uso de la API de Sheets"):
+        uso_api = sheets.snapshot()
+        st.caption(f"Peticiones: {uso_api['requests']} | Reintentos: {uso_api['retries']} | 429: {uso_api['quota_errors']} | Errores: {uso_api['errors']} | Espera acumulada: {uso_api['wait_seconds']:.1f}s")
+        if uso_api["calls"]:
+            st.json(uso_api["calls"])
+
+    with st.expander("⏱️ Rendimiento (último rerun)"):
+        ultimo = perf_run.previous
+        if ultimo is None:
+            st.caption("Sin datos todavía: se muestra el rerun anterior de esta sesión.")
+        else:
+            estado_rerun = " (interrumpido por st.rerun)" if ultimo["interrumpido"] else ""
+            st.caption(f"Total: {ultimo['ms']:.0f} ms{estado_rerun}")
+            df_spans = pd.DataFrame(ultimo["spans"])
+            if not df_spans.empty:
+                df_spans["nombre"] = df_spans["nivel"].map(lambda n: "· " * n) + df_spans["nombre"]
+                columnas = [c for c in ["nombre", "ms", "cache", "hoja", "op", "espera_ms", "reintentos", "error"] if c in df_spans.columns]
+                st.dataframe(df_spans[columnas], hide_index=True, use_container_width=True)
+        st.download_button("📥 Métricas (Prometheus)", gym_perf.prometheus_text(), file_name="gym_metrics.prom",
+                           mime="text/plain", use_container_width=True)
+    
+    st.write("Exporta un respaldo de tus datos.")
+    st.fragment(render_backup_export)()
 
 # 1. Status Bar Header
 if 'current_muscle_group' not in st.session_state:
@@ -314,13 +1233,29 @@ if 'current_muscle_group' not in st.session_state:
 
 current_weight_display = USER_PROFILE['current_weight']
 if UNIDAD_GLOBAL == "Lbs":
-    current_weight_display = round(current_weight_display * 2.20462, 1)
+    current_weight_display = round(gym_data.convert_weight(current_weight_display, "Kg", "Lbs"), 1)
 
 st.info(f"⚖️ **Peso:** {current_weight_display} {UNIDAD_GLOBAL} | 🎯 **Meta:** {USER_PROFILE['goal_body_fat']}% Grasa | ⚡ **Sesión:** {st.session_state.current_muscle_group}")
 
-tab1, tab_hist, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Entrenamiento", "🕰️ Historial", "Composición Corporal", "Progreso Visual", "Nutrición", "⚙️ Configuración", "🛠️ Crear Rutina"])
+# Navegación por vistas: a diferencia de st.tabs, solo se ejecuta (y carga datos / construye
+# gráficos) la vista activa
+VISTAS = ["Entrenamiento", "🕰️ Historial", "Composición Corporal", "Progreso Visual", "Nutrición", "⚙️ Configuración", "🛠️ Crear Rutina"]
+vista = st.radio("Vista", VISTAS, horizontal=True, label_visibility="collapsed", key="vista_activa")
+
+# Streamlit descarta el estado de los widgets que no se dibujan en un rerun; la rutina
+# activa y el rango de fechas se re-asignan para sobrevivir a los cambios de vista
+if "rutina_activa_sel" in st.session_state:
+    st.session_state.rutina_activa_sel = st.session_state.rutina_activa_sel
+st.session_state.rango_fechas = st.session_state.get("rango_fechas", DEFAULT_LOG_RANGE)
 
-with tab1:
+def date_range_selector():
+    # Compartido por Historial y Progreso Visual; devuelve el límite inferior (o None)
+    etiqueta = st.selectbox("Rango de fechas", list(LOG_RANGES), key="rango_fechas")
+    return range_start(LOG_RANGES[etiqueta])
+
+gym_perf.phase(f"vista:{vista}")
+
+if vista == VISTAS[0]:
     # 2. Workout Entry Form
     st.subheader("Entrenamiento Activo")
 
@@ -383,71 +1318,14 @@ with tab1:
             st.dataframe(df_mem[['Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps']], hide_index=True)
             
             if st.button("💾 Finalizar y Sincronizar Libre con Google Sheets", type="primary"):
-                with st.spinner("Sincronizando con Google Sheets..."):
-                    try:
-                        try:
-                            existing_data = load_data()
-                            if existing_data.empty:
-                                existing_data = pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
-                        except Exception:
-                            existing_data = pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
-                        
-                        # Fix KeyError: Enforce strict columns
-                        columnas_estrictas = ['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas']
-                        for col in columnas_estrictas:
-                            if col not in existing_data.columns:
-                                existing_data[col] = ''
-                                
-                        new_data_df = pd.DataFrame(st.session_state.current_workout_session)
-                        
-                        # Mapeo estricto del envío
-                        for col in columnas_estrictas:
-                            if col not in new_data_df.columns:
-                                new_data_df[col] = ''
-                                
-                        new_data_df = new_data_df[columnas_estrictas] # Reorder to lock schema
-                        
-                        # st.write("Debug: Columnas a enviar:", new_data_df.columns.tolist()) # Temporary Logging
-                        
-                        updated_data = pd.concat([existing_data, new_data_df], ignore_index=True).reset_index(drop=True)
-                        
-                        # Actual API execution wrapper
-                        try:
-                            conn.update(worksheet="Logs", data=updated_data)
-                        except Exception as inner_e:
-                            if "UnsupportedOperationError" in str(type(inner_e).__name__) or "WorksheetNotFound" in str(type(inner_e).__name__):
-                                conn.create(worksheet="Logs", data=updated_data)
-                            elif "429" in str(inner_e) or "Quota" in str(inner_e):
-                                # Local CSV Backup fallback
-                                backup_file = 'backup.csv'
-                                if os.path.exists(backup_file):
-                                    df_backup = pd.read_csv(backup_file)
-                                    df_combined = pd.concat([df_backup, new_data_df], ignore_index=True)
-                                else:
-                                    df_combined = new_data_df
-                                df_combined.to_csv(backup_file, index=False)
-                                
-                                st.session_state.current_workout_session = [] # Clear memory
-                                st.warning("⚠️ Google Sheets está saturado (Error 429). Sincronización fallida, datos respaldados localmente en backup.csv.")
-                                st.stop() # Skip success balloon
-                            else:
-                                raise inner_e # Re-raise
-                        
-                        # Success Flow    
-                        st.session_state.current_workout_session = [] # Clear memory ONLY on success
-                        invalidate_logs_cache()
-                        st.balloons()
-                        st.success("🎉 ¡Entrenamiento Libre Sincronizado Exitosamente! 🎉")
-                        st.session_state.start_timer = False
-                        
-                    except Exception as e:
-                        if "429" in str(e) or "Quota" in str(e):
-                            st.error("Google Sheets está saturado. Por favor, espera 30 segundos antes de intentar sincronizar de nuevo.")
-                        else:
-                            st.error(f"❌ Error Técnico al Sincronizar: {str(e)}")
+                sets_libres = st.session_state.current_workout_session
+                st.session_state.current_workout_session = [] # Ya son durables en el journal
+                st.session_state.start_timer = False
+                sync_sets(sets_libres, "🎉 ¡Entrenamiento Libre Sincronizado Exitosamente! 🎉")
     else:
         routine_exercises = routines[rutina_seleccionada]
         routine_results = {}
+        last_session_index = load_last_session_index()
         
         for i, ex_name in enumerate(routine_exercises):
             if i > 0:
@@ -477,30 +1355,18 @@ with tab1:
                         st.rerun()
             
             # --- 3. Comparativa (Log semana pasada) ---
-            df_hist = load_data()
-            if not df_hist.empty:
-                df_hist['Fecha'] = pd.to_datetime(df_hist['Fecha'])
-                # Filter by exercise and sort descending
-                df_ex = df_hist[df_hist['Ejercicio'] == ex_name].sort_values(by='Fecha', ascending=False)
-                if not df_ex.empty:
-                    ultima_sesion_id = df_ex.iloc[0]['ID_Sesion']
-                    if pd.notna(ultima_sesion_id) and ultima_sesion_id != 'N/A':
-                        df_ultima_sesion = df_ex[df_ex['ID_Sesion'] == ultima_sesion_id].sort_values(by='Fecha')
-                        fecha_ultima = df_ultima_sesion.iloc[0]['Fecha'].strftime('%Y-%m-%d')
-                        
-                        with st.expander(f"Ver sesión anterior ({fecha_ultima})"):
-                            # Simple clean display of what was done
-                            for idx, row_hist in df_ultima_sesion.iterrows():
-                                u_hist = row_hist.get("Unidad", "Kg")
-                                st.text(f"Set {idx+1}: {row_hist['Peso']} {u_hist} x {row_hist['Reps']} reps")
-                    else:
-                        # Fallback for Legacy rows without ID_Sesion -> just show last 3 loose logs
-                        df_recent = df_ex.head(3)
-                        with st.expander("Historial reciente"):
-                            for _, row_hist in df_recent.iterrows():
-                                sf_f = row_hist['Fecha'].strftime('%Y-%m-%d')
-                                u_hist = row_hist.get("Unidad", "Kg")
-                                st.text(f"{sf_f}: {row_hist['Peso']} {u_hist} x {row_hist['Reps']} reps")
+            ultima = last_session_index.get(ex_name)
+            if ultima is not None:
+                if not ultima["legacy"]:
+                    with st.expander(f"Ver sesión anterior ({ultima['fecha']})"):
+                        # Simple clean display of what was done
+                        for set_hist in ultima["sets"]:
+                            st.text(f"Set {set_hist['Set_No']}: {set_hist['Peso']} {set_hist['Unidad']} x {set_hist['Reps']} reps")
+                else:
+                    # Fallback for Legacy rows without ID_Sesion -> just show last 3 loose logs
+                    with st.expander("Historial reciente"):
+                        for set_hist in ultima["sets"]:
+                            st.text(f"{set_hist['Dia']}: {set_hist['Peso']} {set_hist['Unidad']} x {set_hist['Reps']} reps")
             
             # --- 1. Fix Reseteo: Inputs dinámicos nativos ---
             for s_idx, set_dict in enumerate(st.session_state[state_key]):
@@ -562,75 +1428,13 @@ with tab1:
             new_data_df = prepare_workout_data()
             
             if not new_data_df.empty:
-                with st.spinner("Sincronizando con Google Sheets..."):
-                    try:
-                        try:
-                            existing_data = load_data()
-                            if existing_data.empty:
-                                existing_data = pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
-                        except Exception:
-                            existing_data = pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
-                            
-                        columnas_estrictas = ['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas']
-                        for col in columnas_estrictas:
-                            if col not in existing_data.columns:
-                                existing_data[col] = ''
-                                
-                        for col in columnas_estrictas:
-                            if col not in new_data_df.columns:
-                                new_data_df[col] = ''
-                                
-                        new_data_df = new_data_df[columnas_estrictas]
-                        
-                        # st.write("Debug: Columnas a enviar:", new_data_df.columns.tolist())
-                        
-                        updated_data = pd.concat([existing_data, new_data_df], ignore_index=True).reset_index(drop=True)
-                        
-                        # Actual API execution wrapper
-                        try:
-                            conn.update(worksheet="Logs", data=updated_data)
-                        except Exception as inner_e:
-                            if "UnsupportedOperationError" in str(type(inner_e).__name__) or "WorksheetNotFound" in str(type(inner_e).__name__):
-                                conn.create(worksheet="Logs", data=updated_data)
-                            elif "429" in str(inner_e) or "Quota" in str(inner_e):
-                                # Local CSV Backup fallback
-                                backup_file = 'backup.csv'
-                                if os.path.exists(backup_file):
-                                    df_backup = pd.read_csv(backup_file)
-                                    df_combined = pd.concat([df_backup, new_data_df], ignore_index=True)
-                                else:
-                                    df_combined = new_data_df
-                                df_combined.to_csv(backup_file, index=False)
-                                
-                                # Cleanup Session states
-                                for i in range(len(routine_exercises)):
-                                    key_to_del = f"sets_{rutina_seleccionada}_{i}"
-                                    if key_to_del in st.session_state:
-                                        del st.session_state[key_to_del]
-                                
-                                st.warning("⚠️ Google Sheets está saturado (Error 429). Sincronización fallida, datos respaldados localmente en backup.csv.")
-                                st.stop() # Skip success balloon
-
-                            else:
-                                raise inner_e # Re-raise for the outer block to catch and display
-
-                        # Success Flow
-                        invalidate_logs_cache()
-                        st.balloons()
-                        st.success("🎉 ¡Entrenamiento Sincronizado Exitosamente! 🎉")
-                        
-                        # Cleanup Session states ONLY on success
-                        for i in range(len(routine_exercises)):
-                            key_to_del = f"sets_{rutina_seleccionada}_{i}"
-                            if key_to_del in st.session_state:
-                                del st.session_state[key_to_del]
-                                
-                        st.session_state.start_timer = False
-                    except Exception as e:
-                        if "429" in str(e) or "Quota" in str(e):
-                            st.error("Google Sheets está saturado. Por favor, espera 30 segundos antes de intentar sincronizar de nuevo.")
-                        else:
-                            st.error(f"❌ Error Técnico al Sincronizar: {str(e)}")
+                # Cleanup Session states: los sets ya son durables en el journal
+                for i in range(len(routine_exercises)):
+                    key_to_del = f"sets_{rutina_seleccionada}_{i}"
+                    if key_to_del in st.session_state:
+                        del st.session_state[key_to_del]
+                st.session_state.start_timer = False
+                sync_sets(new_data_df.to_dict('records'), "🎉 ¡Entrenamiento Sincronizado Exitosamente! 🎉")
             else:
                 st.warning("⚠️ No se registraron sets (todos tenían 0 peso y 0 reps). No hay nada que guardar.")
                 
@@ -650,69 +1454,79 @@ with tab1:
         st.session_state.start_timer = True
         
     if st.session_state.start_timer:
-        timer_placeholder = st.empty()
         st.session_state.start_timer = False # Reset so it doesn't loop
-        for remaining in range(rest_time, 0, -1):
-            timer_placeholder.markdown(f"""
-            <div style="background-color: #1E1E1E; border: 2px solid #333; border-radius: 15px; padding: 20px; text-align: center; margin-top: 10px;">
-                <h1 style="font-size: 4rem; margin: 0; color: #FFFFFF; font-family: monospace;">{remaining}</h1>
-                <p style="color: #888; margin-top: 5px; font-size: 1.2rem;">Descansando...</p>
-            </div>
-            """, unsafe_allow_html=True)
-            time.sleep(1)
-            
-        timer_placeholder.markdown(f"""
-        <div style="background-color: #FF4B4B; border: 2px solid #FF4B4B; border-radius: 15px; padding: 20px; text-align: center; margin-top: 10px;">
-            <h1 style="font-size: 4rem; margin: 0; color: #FFFFFF; font-family: monospace;">0</h1>
-            <p style="color: #FFFFFF; margin-top: 5px; font-size: 1.2rem; font-weight: bold;">¡Tiempo Terminado!</p>
+        st.session_state.timer_end = time.time() + rest_time
+        
+    # La cuenta atrás corre en el navegador: el script no duerme y el resto de la
+    # página sigue respondiendo. timer_end sobrevive a los reruns mientras se descansa.
+    timer_end = st.session_state.get("timer_end")
+    if timer_end:
+        remaining = max(0, int(round(timer_end - time.time())))
+        if remaining == 0:
+            st.session_state.timer_end = None
+        if remaining > 0 and st.button("DETENER TEMPORIZADOR"):
+            st.session_state.timer_end = None
+            st.rerun()
+        components.html(f"""
+        <div id="rest-timer" style="background-color: #1E1E1E; border: 2px solid #333; border-radius: 15px; padding: 20px; text-align: center; margin-top: 10px; font-family: sans-serif;">
+            <h1 id="rest-timer-value" style="font-size: 4rem; margin: 0; color: #FFFFFF; font-family: monospace;">{remaining}</h1>
+            <p id="rest-timer-label" style="color: #888; margin-top: 5px; font-size: 1.2rem;">Descansando...</p>
         </div>
-        """, unsafe_allow_html=True)
+        <script>
+            const end = Date.now() + {remaining} * 1000;
+            const box = document.getElementById("rest-timer");
+            const value = document.getElementById("rest-timer-value");
+            const label = document.getElementById("rest-timer-label");
+            function tick() {{
+                const left = Math.max(0, Math.ceil((end - Date.now()) / 1000));
+                value.textContent = left;
+                if (left > 0) {{
+                    setTimeout(tick, 250);
+                    return;
+                }}
+                box.style.backgroundColor = "#FF4B4B";
+                box.style.borderColor = "#FF4B4B";
+                label.style.color = "#FFFFFF";
+                label.style.fontWeight = "bold";
+                label.textContent = "¡Tiempo Terminado!";
+            }}
+            tick();
+        </script>
+        """, height=170)
 
-with tab_hist:
+if vista == VISTAS[1]:
     st.header("🕰️ Modo Explorador de Sesiones")
+    desde = date_range_selector()
     
-    df_hist_full = load_data()
+    df_hist_full = load_logs_since(desde)
     if not df_hist_full.empty:
-        df_hist_full['Fecha'] = pd.to_datetime(df_hist_full['Fecha'])
-        
-        # Identify unique sessions (except Legacy/N/A loose logs)
-        sesiones_agrupadas = df_hist_full[df_hist_full['ID_Sesion'] != 'N/A'].groupby('ID_Sesion')
-        
-        sesiones_lista = []
-        for id_sesion, group in sesiones_agrupadas:
-            fecha_sesion = group['Fecha'].iloc[0].strftime('%Y-%m-%d %H:%M')
-            rut_nombre = group['Rutina'].iloc[0] if 'Rutina' in group.columns else 'Desconocida'
-            sesiones_lista.append((fecha_sesion, rut_nombre, id_sesion))
-            
-        # Sort by date descending
-        sesiones_lista.sort(key=lambda x: x[0], reverse=True)
+        # Resumen precalculado: una fila por sesión, ya ordenado por fecha descendente
+        df_sesiones = load_session_summary(desde)
         
-        if sesiones_lista:
-            opciones_formateadas = [f"{f} | {r}" for f, r, _ in sesiones_lista]
+        if not df_sesiones.empty:
+            opciones_formateadas = df_sesiones['Etiqueta'].tolist()
             seleccion = st.selectbox("Seleccionar Sesión Pasada", range(len(opciones_formateadas)), format_func=lambda i: opciones_formateadas[i])
             
-            _, _, id_sesion_sel = sesiones_lista[seleccion]
+            sesion_sel = df_sesiones.iloc[seleccion]
+            id_sesion_sel = sesion_sel['ID_Sesion']
             
             df_sesion_sel = df_hist_full[df_hist_full['ID_Sesion'] == id_sesion_sel].copy()
-            fecha_sel = df_sesion_sel['Fecha'].iloc[0].strftime('%d de %B, %Y a las %H:%M')
-            rotulo_rutina = df_sesion_sel['Rutina'].iloc[0] if 'Rutina' in df_sesion_sel.columns else 'Desconocida'
+            fecha_sel = sesion_sel['Fecha'].strftime('%d de %B, %Y a las %H:%M')
+            rotulo_rutina = sesion_sel['Rutina']
             
             st.divider()
             st.subheader(f"{rotulo_rutina}")
             st.caption(f"🗓️ {fecha_sel}")
             
-            # Calculo de Volumen Total de la sesion (convertimos a unidad global para métrica única)
-            volumen_total = 0
-            for _, row in df_sesion_sel.iterrows():
-                p_kgs = convert_weight(float(row['Peso']), row.get('Unidad', 'Kg'), UNIDAD_GLOBAL)
-                volumen_total += (p_kgs * int(row['Reps']))
+            # Volumen Total de la sesion en la unidad global (precalculado en ambas unidades)
+            volumen_total = sesion_sel['Volumen_Lbs'] if UNIDAD_GLOBAL == "Lbs" else sesion_sel['Volumen_Kg']
             
             st.metric("Volumen Total", f"{volumen_total:,.1f} {UNIDAD_GLOBAL}")
             
             # Tabla Resumen Limpia
             # Las columnas ahora son exactas a las nuevas estructuras
             columnas_disp = [c for c in ['Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps'] if c in df_sesion_sel.columns]
-            df_resumen = df_sesion_sel[columnas_disp].copy()
+            df_resumen = gym_data.to_sheet_frame(df_sesion_sel[columnas_disp])
             
             st.dataframe(
                 df_resumen,
@@ -721,19 +1535,18 @@ with tab_hist:
             )
             
             if st.button("Eliminar esta Sesión Completa 🗑️", type="primary"):
-                df_updated = df_hist_full[df_hist_full['ID_Sesion'] != id_sesion_sel].reset_index(drop=True)
-                if df_updated.empty:
-                    df_updated = pd.DataFrame(columns=['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas'])
-                safe_gsheets_update("Logs", df_updated)
-                st.success("Sesión eliminada correctamente.")
-                st.rerun()
+                if delete_session(id_sesion_sel):
+                    st.success("Sesión eliminada correctamente.")
+                    st.rerun()
                 
         else:
             st.info("No tienes rutinas agrupadas por sesión completadas usando el Gestor.")
+    elif desde is not None:
+        st.info("No hay sesiones en este rango de fechas. Prueba con un rango mayor.")
     else:
         st.info("No hay registros históricos aún.")
 
-with tab2:
+if vista == VISTAS[2]:
     st.header("Composición Corporal")
     
     col_a, col_b, col_c = st.columns(3)
@@ -747,7 +1560,7 @@ with tab2:
     calc_pressed = st.button("CALCULAR Y GUARDAR 📊")
     
     if calc_pressed:
-        peso_lbs = peso_comp * 2.20462
+        peso_lbs = gym_data.convert_weight(peso_comp, "Kg", "Lbs")
         cintura_in = cintura / 2.54
         
         is_male = USER_PROFILE.get("gender", "Hombre").lower() == "hombre"
@@ -780,52 +1593,20 @@ with tab2:
         st.caption("Fórmula utilizada: Estimación YMCA para Grasa Corporal y FFMI estándar.")
         st.success("✅ Datos guardados en el historial.")
 
-with tab3:
+if vista == VISTAS[3]:
     st.header("Progreso Visual")
+    desde = date_range_selector()
     
     # --- Gráfico 1: Evolución de Peso y Grasa ---
     st.subheader("Evolución de Composición Corporal")
     df_comp = load_body_comp_data()
+    if desde is not None and not df_comp.empty:
+        df_comp = df_comp[gym_data.parse_dates(df_comp['Fecha']) >= desde]
     
     if not df_comp.empty and len(df_comp) > 0:
-        # Sort by date
-        df_comp['Fecha'] = pd.to_datetime(df_comp['Fecha'])
-        df_comp = df_comp.sort_values(by='Fecha')
-        
-        # Create figure with secondary y-axis
-        fig_comp = go.Figure()
-        
-        # Add Peso trace (primary Y)
-        fig_comp.add_trace(go.Scatter(
-            x=df_comp['Fecha'], y=df_comp['Peso'],
-            name='Peso (kg)',
-            mode='lines+markers',
-            line=dict(color='#00FFFF', width=3),
-            marker=dict(size=8, color='#00FFFF', line=dict(width=1, color='#0E1117'))
-        ))
-        
-        # Add Grasa trace (secondary Y)
-        fig_comp.add_trace(go.Scatter(
-            x=df_comp['Fecha'], y=df_comp['Grasa_pct'],
-            name='% Grasa',
-            mode='lines+markers',
-            yaxis='y2',
-            line=dict(color='#39FF14', width=3, dash='dot'),
-            marker=dict(size=8, color='#39FF14', line=dict(width=1, color='#0E1117'))
-        ))
-        
-        # Update layout for secondary Y-axis and mobile responsiveness
-        fig_comp.update_layout(
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color="#E0E0CE")),
-            margin=dict(l=0, r=0, t=30, b=0),
-            yaxis=dict(title=f'Peso ({UNIDAD_GLOBAL})', title_font=dict(color='#00FFFF'), tickfont=dict(color='#00FFFF'), gridcolor='#1A1D24'),
-            yaxis2=dict(title='% Grasa', title_font=dict(color='#39FF14'), tickfont=dict(color='#39FF14'), anchor='x', overlaying='y', side='right', gridcolor='#1A1D24'),
-            xaxis=dict(gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
-        
-        st.plotly_chart(fig_comp, use_container_width=True)
+        fig_comp = build_body_comp_figure(data_version(df_comp), UNIDAD_GLOBAL, df_comp)
+        with gym_perf.span("plotly_chart", grafico="composicion"):
+            st.plotly_chart(fig_comp, use_container_width=True)
     else:
         st.info("Calcula y guarda tu composición corporal en la pestaña anterior para ver tu progreso.")
         
@@ -833,60 +1614,14 @@ with tab3:
     
     # --- Gráfico 2: Volumen Semanal por Grupo Muscular ---
     st.subheader("Volumen Semanal por Grupo Muscular")
-    df_train = load_data()
+    weekly_rollup, routine_rollup = load_volume_rollups(desde)
+    columna_volumen = 'Volumen_Lbs' if UNIDAD_GLOBAL == "Lbs" else 'Volumen_Kg'
     
-    if not df_train.empty:
-        # Map exercise to category
-        def get_category(ejercicio):
-            for cat, ejercicios in EXERCISE_CATALOG.items():
-                if ejercicio in ejercicios:
-                    return cat
-            return "Otros"
-            
-        df_train['Grupo Muscular'] = df_train['Ejercicio'].apply(get_category)
-        
-        # Normalize weights to global unit for fair volume comparison
-        df_train['Peso_Norm'] = df_train.apply(lambda row: convert_weight(float(row['Peso']), row.get('Unidad', 'Kg'), UNIDAD_GLOBAL), axis=1)
-        df_train['Volumen'] = df_train['Peso_Norm'] * df_train['Reps']
-        
-        # Ensure 'Fecha' is datetime
-        df_train['Fecha'] = pd.to_datetime(df_train['Fecha'])
-        
-        # Group by week and muscle group
-        # Using week period allows nice alignment on charts
-        df_train['Semana'] = df_train['Fecha'].dt.to_period('W').apply(lambda r: r.start_time)
-        
-        df_grouped = df_train.groupby(['Semana', 'Grupo Muscular'])['Volumen'].sum().reset_index()
-        
-        # Create bar chart
-        if not df_grouped.empty:
-            cyan_neon_palette = ['#00FFFF', '#39FF14', '#FF00FF', '#FFFF00', '#FF3914', '#9D00FF']
-            fig_vol = px.bar(
-                df_grouped, 
-                x="Semana", 
-                y="Volumen", 
-                color="Grupo Muscular",
-                title="Volumen (Peso x Reps)",
-                barmode='stack', # Stacked is usually better to see total weekly volume
-                color_discrete_sequence=cyan_neon_palette
-            )
-            
-            fig_vol.update_layout(
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color="#E0E0CE")),
-                margin=dict(l=0, r=0, t=30, b=0),
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                xaxis=dict(title="", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
-                yaxis=dict(title=f"Volumen ({UNIDAD_GLOBAL})", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
-                title_font=dict(color="#E0E0CE")
-            )
-            
-            # Reduce brightness of bars a bit to fit dark theme, or add borders
-            fig_vol.update_traces(marker_line_width=1, marker_line_color='#0E1117')
-            
+    if not weekly_rollup.empty:
+        # Tabla semanal materializada: el coste depende del número de semanas, no de sets
+        fig_vol = build_weekly_volume_figure(data_version(weekly_rollup), UNIDAD_GLOBAL, weekly_rollup)
+        with gym_perf.span("plotly_chart", grafico="volumen_semanal"):
             st.plotly_chart(fig_vol, use_container_width=True)
-        else:
-            st.info("No hay datos de entrenamiento suficientes para mostrar el volumen semanal.")
     else:
         st.info("Registra algunos sets de entrenamiento para ver tu volumen semanal.")
 
@@ -894,39 +1629,17 @@ with tab3:
     
     # --- Gráfico 3: Volumen Histórico por Rutina ---
     st.subheader("Evolución de Volumen por Rutina")
-    if not df_train.empty and 'Rutina' in df_train.columns:
-        rutinas_disponibles = [r for r in df_train['Rutina'].unique() if r not in ["Legacy", "Libre"] and pd.notna(r)]
+    if not routine_rollup.empty:
+        rutinas_disponibles = [r for r in routine_rollup.index.get_level_values('Rutina').unique() if r not in ["Legacy", "Libre"] and pd.notna(r)]
         
         if rutinas_disponibles:
             rutina_filtro = st.selectbox("Seleccionar Rutina", rutinas_disponibles)
-            df_rutina = df_train[df_train['Rutina'] == rutina_filtro].copy()
+            volumen_rutina = routine_rollup.loc[[rutina_filtro]]
             
-            if not df_rutina.empty:
-                df_rutina['Fecha'] = pd.to_datetime(df_rutina['Fecha'])
-                df_rutina['Día'] = df_rutina['Fecha'].dt.date
-                df_rutina['Volumen'] = df_rutina['Peso_Norm'] * df_rutina['Reps']
-                
-                volumen_por_sesion = df_rutina.groupby('Día')['Volumen'].sum().reset_index()
-                
-                fig_rutina = px.line(
-                    volumen_por_sesion, 
-                    x='Día', 
-                    y='Volumen',
-                    title=f"Volumen Total Levantado: {rutina_filtro}",
-                    markers=True
-                )
-                
-                fig_rutina.update_traces(line=dict(color='#FF00FF', width=3), marker=dict(size=8, color='#FF00FF', line=dict(width=1, color='#0E1117')))
-                fig_rutina.update_layout(
-                    margin=dict(l=0, r=0, t=40, b=0),
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    xaxis=dict(title="", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
-                    yaxis=dict(title=f"Volumen ({UNIDAD_GLOBAL})", gridcolor='#1A1D24', tickfont=dict(color='#E0E0CE')),
-                    title_font=dict(color="#E0E0CE")
-                )
-                
-                st.plotly_chart(fig_rutina, use_container_width=True)
+            if not volumen_rutina.empty:
+                fig_rutina = build_routine_volume_figure(data_version(volumen_rutina), UNIDAD_GLOBAL, rutina_filtro, volumen_rutina)
+                with gym_perf.span("plotly_chart", grafico="volumen_rutina"):
+                    st.plotly_chart(fig_rutina, use_container_width=True)
             else:
                 st.info("No hay datos suficientes para esta rutina.")
         else:
@@ -934,7 +1647,7 @@ with tab3:
     else:
         st.info("No hay datos de rutinas registrados aún.")
 
-with tab4:
+if vista == VISTAS[4]:
     st.header("Calculadora Nutricional")
     
     # 1. Fetch latest body comp data
@@ -990,70 +1703,86 @@ with tab4:
     st.subheader("📸 IA Food Lens (Nutrición con IA)")
     st.write("Sube una foto de tu comida o tómale una foto. La IA analizará los ingredientes, estimará la porción y extraerá los macros para ti.")
     
+    # FOOD_LENS_MODEL=stub usa un modelo local de pruebas (sin red ni API key)
+    usar_stub = os.environ.get("FOOD_LENS_MODEL") == "stub"
     api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
+    if not api_key and not usar_stub:
         st.warning("⚠️ No se encontró la variable de entorno `GEMINI_API_KEY`. Por favor configúrala en tu sistema para usar esta función.")
     else:
-        genai.configure(api_key=api_key)
-        
         with st.expander("Abrir Escáner de Comida", expanded=False):
             img_file_buffer = st.camera_input("Toma una foto de tu comida")
-            uploaded_file = st.file_uploader("O sube una imagen de tu galería", type=['png', 'jpg', 'jpeg'])
             
-            image_to_analyze = img_file_buffer if img_file_buffer else uploaded_file
-            
-            if image_to_analyze:
-                image = Image.open(image_to_analyze)
-                st.image(image, caption="Comida a analizar", use_container_width=True)
+            if img_file_buffer:
+                raw_image = img_file_buffer.getvalue()
+                # Se sube una versión reducida (JPEG <= 1024 px) en lugar de la foto original
+                st.image(load_food_preview(food_lens.image_key(raw_image), raw_image), caption="Comida a analizar", use_container_width=True)
                 
                 if st.button("Analizar Comida con IA 🤖", type="primary"):
                     with st.spinner("Analizando plato... calculando macros..."):
                         try:
-                            # Use Gemini 1.5 Flash (vision capable) - standard robust model
-                            model = genai.GenerativeModel('gemini-1.5-flash')
-                            
-                            prompt = """
-                            Eres un experto nutricionista predictivo. Analiza la imagen de esta comida.
-                            Identifica los alimentos presentes y trata de estimar el tamaño de la porción visualmente.
-                            A partir de eso, calcula los macronutrientes aproximados totales del plato.
-                            Tu ÚNICA salida debe ser un objeto JSON estrictamente válido, usando las siguientes claves.
-                            No devuelvas texto plano, ni bloques de código markdown extra (como ```json), SOLO el JSON puro:
-                            {
-                                "food_name": "Nombre descriptivo resumido del plato (ej. Ensalada con Pollo, 2 Huevos Fritos con Pan)",
-                                "calories": <número entero>,
-                                "protein": <número entero gramos>,
-                                "fats": <número entero gramos>,
-                                "carbs": <número entero gramos>
-                            }
-                            Si la imagen no parece ser comida, devuelve 0 en los valores y "No es comida" como nombre.
-                            """
-                            response = model.generate_content([prompt, image])
-                            
-                            # Clean up the response in case it returned markdown formatting anyway
-                            raw_text = response.text.replace("```json", "").replace("```", "").strip()
-                            
-                            food_data = json.loads(raw_text)
+                            model = food_lens.get_model(api_key)
+                            food_data = food_lens.analyze_cached(model, raw_image, timeout=food_lens.IMAGE_TIMEOUT_SECONDS)
                             
                             # Store in session state to auto-populate the form below
-                            st.session_state.temp_food_name = food_data.get("food_name", "Desconocido")
-                            st.session_state.temp_cal = int(food_data.get("calories", 0))
-                            st.session_state.temp_p = int(food_data.get("protein", 0))
-                            st.session_state.temp_g = int(food_data.get("fats", 0))
-                            st.session_state.temp_c = int(food_data.get("carbs", 0))
+                            # (food_lens ya valida la respuesta: macros como int >= 0)
+                            st.session_state.temp_food_name = food_data["food_name"]
+                            st.session_state.temp_cal = food_data["calories"]
+                            st.session_state.temp_p = food_data["protein"]
+                            st.session_state.temp_g = food_data["fats"]
+                            st.session_state.temp_c = food_data["carbs"]
                             
                             st.success("¡Análisis completado! Los datos se han copiado a tu formulario abajo.")
                             
                         except Exception as e:
                             st.error(f"Error al analizar la imagen: {e}")
+            
+            # Varias fotos (p.ej. todas las comidas del día): se analizan en paralelo y cada
+            # resultado se guarda en cuanto llega en el día que muestra el simulador de abajo
+            # (su date_input se dibuja después; su valor ya está en session_state)
+            uploaded_files = st.file_uploader("O sube una o varias imágenes de tu galería", type=['png', 'jpg', 'jpeg'], accept_multiple_files=True)
+            
+            if uploaded_files:
+                st.caption(f"{len(uploaded_files)} imagen(es) seleccionada(s)")
+                if st.button(f"Analizar {len(uploaded_files)} Comida(s) con IA 🤖", type="primary"):
+                    model = food_lens.get_model(api_key)
+                    dia_fotos = st.session_state.get("food_diary_day", datetime.now().date()).strftime("%Y-%m-%d")
+                    images = [(f.name, f.getvalue()) for f in uploaded_files]
+                    progreso = st.progress(0.0, text="Analizando platos...")
+                    for n, (nombre, food_data, error) in enumerate(food_lens.analyze_images(model, images), start=1):
+                        # Un resultado inválido o un fallo al guardarlo solo afecta a su imagen
+                        try:
+                            if error is not None:
+                                raise error
+                            food_diary.add_entry(
+                                dia_fotos, food_data["food_name"],
+                                food_data["calories"], food_data["protein"],
+                                food_data["fats"], food_data["carbs"], origen="ia")
+                            st.write(f"✅ {nombre}: **{food_data['food_name']}** ({food_data['calories']} kcal)")
+                        except Exception as e:
+                            st.error(f"{nombre}: error al analizar la imagen: {e}")
+                        progreso.progress(n / len(images), text=f"Analizadas {n}/{len(images)}")
+                    st.success(f"¡Análisis completado! Las comidas se han añadido a tu simulador abajo (día {dia_fotos}).")
 
     st.divider()
     
-    # 5. Daily Simulator (Ephemeral state)
+    # 5. Daily Simulator (diario persistente en food_diary.sqlite)
     st.subheader("Simulador Diario")
     st.write("Añade alimentos para ver cómo encajan en tus macros de hoy. Si usaste IA Food Lens, revisa o edita los datos aquí antes de agregar.")
     
-    if "consumed_foods" not in st.session_state:
-        st.session_state.consumed_foods = []
+    dia_diario = st.date_input("Día", value=datetime.now().date(), key="food_diary_day").strftime("%Y-%m-%d")
+    
+    # Búsqueda en la base local (alimentos ya registrados): se vuelven a añadir sin llamar a la IA
+    busqueda = st.text_input("🔎 Buscar en mis alimentos", placeholder="ej. avena, pollo...")
+    if busqueda:
+        resultados = food_diary.search_foods(busqueda)
+        if not resultados:
+            st.caption("Sin coincidencias en tu base de alimentos.")
+        for i, alimento in enumerate(resultados):
+            r1, r2 = st.columns([4, 1])
+            r1.write(f"**{alimento['nombre']}**: {alimento['cal']} kcal (P:{alimento['p']} G:{alimento['g']} C:{alimento['c']})")
+            if r2.button("Añadir", key=f"food_hit_{i}"):
+                food_diary.add_entry(dia_diario, alimento['nombre'], alimento['cal'], alimento['p'], alimento['g'], alimento['c'], origen="base")
+                st.rerun()
         
     # Get values from session state if they exist, otherwise default to empty/0
     default_name = st.session_state.pop("temp_food_name", "")
@@ -1072,24 +1801,20 @@ with tab4:
             
         m1, m2, m3 = st.columns(3)
         with m1:
-            food_p = st.number_input("Prot (g)", min_value=0, step=1)
+            food_p = st.number_input("Prot (g)", min_value=0, step=1, value=default_p)
         with m2:
-            food_g = st.number_input("Grasa (g)", min_value=0, step=1)
+            food_g = st.number_input("Grasa (g)", min_value=0, step=1, value=default_g)
         with m3:
-            food_c = st.number_input("Carbo (g)", min_value=0, step=1)
+            food_c = st.number_input("Carbo (g)", min_value=0, step=1, value=default_c)
             
         add_food = st.form_submit_button("Añadir 🍳")
         
         if add_food and food_name != "":
-            st.session_state.consumed_foods.append({
-                "nombre": food_name, "cal": food_cal, "p": food_p, "g": food_g, "c": food_c
-            })
+            food_diary.add_entry(dia_diario, food_name, food_cal, food_p, food_g, food_c)
             
-    # Calculate consumed
-    cons_cal = sum(f["cal"] for f in st.session_state.consumed_foods)
-    cons_p = sum(f["p"] for f in st.session_state.consumed_foods)
-    cons_g = sum(f["g"] for f in st.session_state.consumed_foods)
-    cons_c = sum(f["c"] for f in st.session_state.consumed_foods)
+    # Totales del día calculados en SQLite
+    totales = food_diary.daily_totals(dia_diario)
+    cons_cal, cons_p, cons_g, cons_c = totales["cal"], totales["p"], totales["g"], totales["c"]
     
     st.markdown("### Restante Hoy")
     
@@ -1104,13 +1829,18 @@ with tab4:
     render_progress("🥑 Grasas (g)", cons_g, fat_meta, "normal")
     render_progress("🍚 Carbos (g)", cons_c, carb_meta, "normal")
     
-    if len(st.session_state.consumed_foods) > 0:
+    alimentos_dia = food_diary.entries(dia_diario)
+    if len(alimentos_dia) > 0:
         with st.expander("Ver lista de alimentos hoy"):
-            for idx, f in enumerate(st.session_state.consumed_foods):
-                st.write(f"- **{f['nombre']}**: {f['cal']} kcal (P:{f['p']} G:{f['g']} C:{f['c']})")
+            for f in alimentos_dia:
+                l1, l2 = st.columns([5, 1])
+                l1.write(f"- **{f['nombre']}**: {f['cal']} kcal (P:{f['p']} G:{f['g']} C:{f['c']})")
+                if l2.button("🗑️", key=f"food_del_{f['id']}"):
+                    food_diary.delete_entry(f['id'])
+                    st.rerun()
                 
             if st.button("Limpiar Registro"):
-                st.session_state.consumed_foods = []
+                food_diary.clear_day(dia_diario)
                 st.rerun()
 
 # Footer spacing
@@ -1118,7 +1848,7 @@ st.write("")
 st.write("") 
 st.write("") 
 
-with tab5:
+if vista == VISTAS[5]:
     st.header("⚙️ Configuraciones Generales")
     st.subheader("Preferencias de la App")
     
@@ -1137,6 +1867,45 @@ with tab5:
         
     st.divider()
     
+    st.subheader("Historial de Entrenamiento")
+    particiones = log_partitions()
+    st.caption(f"Particiones anuales: {', '.join(particiones[1:]) or 'ninguna todavía'}")
+    filas_historicas = len(load_log_partition(LEGACY_LOGS_WORKSHEET))
+    if filas_historicas:
+        st.write(f"La hoja histórica '{LEGACY_LOGS_WORKSHEET}' todavía tiene {filas_historicas} sets. Repartirlos por año hace que las vistas recientes solo lean los últimos años.")
+        if st.button("Particionar historial por año 🗂️"):
+            st.session_state.setdefault("sync_jobs", []).append(
+                (submit_legacy_partition(), "✅ {n} sets repartidos en hojas anuales.", "La hoja histórica sigue intacta; repetirlo no duplica sets."))
+            st.info("Repartiendo el historial en hojas anuales en segundo plano; el progreso aparece en el panel lateral.")
+    lapidas = len(load_tombstones())
+    if lapidas:
+        st.write(f"{lapidas} sesiones borradas siguen ocupando filas en las hojas; se eliminan físicamente en segundo plano al acumular {TOMBSTONE_COMPACT_MIN} o pasados {TOMBSTONE_MAX_AGE_DAYS} días.")
+        if st.button("Compactar borrados ahora 🧹"):
+            st.session_state.setdefault("sync_jobs", []).append(
+                (submit_tombstone_compaction(), "✅ {n} sets borrados eliminados de las hojas.", "Los borrados siguen ocultos y se compactarán más tarde."))
+            st.info("Compactación en curso en segundo plano; el progreso aparece en el panel lateral.")
+    
+    st.divider()
+    
+    st.subheader("Composición Corporal")
+    sync_composicion = st.checkbox(
+        f"Copiar cada medición a la hoja '{BODY_COMP_WORKSHEET}'",
+        value=body_comp_sync_enabled(),
+        help="El historial local se pierde al redesplegar el contenedor; con la copia en Google Sheets se restaura automáticamente."
+    )
+    if sync_composicion != body_comp_sync_enabled():
+        APP_CONFIG["sync_composicion"] = sync_composicion
+        save_config(APP_CONFIG)
+        st.rerun()
+    if sync_composicion and st.button("Subir historial completo a Google Sheets ☁️"):
+        try:
+            upload_body_comp()
+            st.success(f"Historial de composición copiado a '{BODY_COMP_WORKSHEET}'.")
+        except Exception as e:
+            st.error(f"❌ No se pudo copiar el historial: {e}")
+    
+    st.divider()
+    
     st.header("Gestión de Diccionario de Ejercicios")
     st.write("Añade nuevos ejercicios o gestiona los que ya no utilices. Los cambios se reflejarán instantáneamente en la pestaña de Entrenamiento.")
     
@@ -1164,7 +1933,7 @@ with tab5:
     st.subheader("Catálogo Actual")
     
     try:
-        df_ej = conn.read(worksheet="Ejercicios", ttl=600)
+        df_ej = read_worksheet("Ejercicios")
         df_ej = df_ej.dropna(how="all")
         if not df_ej.empty and 'Grupo Muscular' in df_ej.columns and 'Nombre del Ejercicio' in df_ej.columns:
             df_ej = df_ej.sort_values(by=["Grupo Muscular", "Nombre del Ejercicio"])
@@ -1181,13 +1950,12 @@ with tab5:
             if st.button("Guardar Cambios 💾", type="primary"):
                 edited_ej = edited_ej.dropna(subset=['Nombre del Ejercicio'])
                 safe_gsheets_update("Ejercicios", edited_ej)
-                invalidate_caches()
                 st.success("¡Catálogo actualizado en Google Sheets!")
                 st.rerun()
     except Exception:
         st.info("Configura tu base de datos para ver el catálogo interactivo.")
 
-with tab6:
+if vista == VISTAS[6]:
     st.header("Creador de Rutinas")
     st.write("Crea plantillas personalizadas agrupando ejercicios de tu diccionario.")
     
@@ -1232,4 +2000,7 @@ with tab6:
     else:
         st.info("No tienes rutinas personalizadas creadas aún.")
 
-
+# Fin del rerun: comprobación de versiones en segundo plano (después del render) y
+# registro en el JSONL (si el script no se cortó antes con st.rerun)
+submit_version_poll()
+gym_perf.finish_run(perf_run)
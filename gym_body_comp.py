@@ -0,0 +1,97 @@
+# Historial de composición corporal: CSV local de solo-añadir.
+# Cada medición se añade como una línea (con fsync) en lugar de reescribir el fichero;
+# si hay varias el mismo día gana la última, y eso se resuelve al leer. La lectura
+# reescribe el fichero ya deduplicado cuando acumula suficientes líneas repetidas.
+import csv
+import os
+import threading
+
+import pandas as pd
+
+import gym_data
+
+BODY_COMP_FILE = 'body_comp_log.csv'
+BODY_COMP_COLUMNS = ["Fecha", "Peso", "Grasa_pct", "FFMI"]
+BODY_COMP_DATE_FORMAT = "%Y-%m-%d"
+COMPACT_MIN_DUPLICATES = 20
+
+_lock = threading.Lock()
+
+def stamp(path=BODY_COMP_FILE):
+    # (mtime, tamaño) del fichero como versión para las cachés; None si no existe
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+def append(fecha, peso, grasa_pct, ffmi, path=BODY_COMP_FILE):
+    with _lock:
+        nuevo = stamp(path) is None or os.path.getsize(path) == 0
+        sin_salto = False
+        if not nuevo:
+            # Un fichero editado a mano puede no terminar en salto de línea
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                sin_salto = f.read(1) != b"\n"
+        with open(path, 'a', encoding='utf-8', newline='') as f:
+            if sin_salto:
+                f.write("\n")
+            writer = csv.writer(f, lineterminator="\n")
+            if nuevo:
+                writer.writerow(BODY_COMP_COLUMNS)
+            writer.writerow([fecha, peso, grasa_pct, ffmi])
+            f.flush()
+            os.fsync(f.fileno())
+
+def _read_raw(path):
+    if stamp(path) is None:
+        return pd.DataFrame(columns=BODY_COMP_COLUMNS)
+    return pd.read_csv(path)
+
+def normalize_dates(fechas):
+    # Fecha siempre ISO: una hoja de Sheets puede devolver "15/10/2026". Las que no se
+    # pueden interpretar se dejan tal cual (no se pierde la fila)
+    fechas = fechas.astype(object)
+    parsed = gym_data.parse_dates(fechas.astype(str).where(fechas.notna()))
+    return parsed.dt.strftime(BODY_COMP_DATE_FORMAT).where(parsed.notna(), fechas)
+
+def dedupe(df):
+    # Una medición por día (la última registrada), en orden cronológico
+    df = df.assign(Fecha=normalize_dates(df['Fecha']))
+    df = df.drop_duplicates(subset=['Fecha'], keep='last')
+    return df.sort_values(by='Fecha', kind='stable', key=lambda f: f.astype(str)).reset_index(drop=True)
+
+def _read_compacted(path, min_duplicates):
+    # Lectura deduplicada; si ya hay suficientes líneas repetidas se reescribe el fichero.
+    # Devuelve (historial, líneas eliminadas)
+    df = _read_raw(path)
+    compacto = dedupe(df)
+    duplicadas = len(df) - len(compacto)
+    if duplicadas < max(min_duplicates, 1):
+        return compacto, 0
+    _write(compacto, path)
+    return compacto, duplicadas
+
+def read(path=BODY_COMP_FILE, min_duplicates=COMPACT_MIN_DUPLICATES):
+    # La compactación se hace aquí, al leer, y no en cada medición añadida
+    with _lock:
+        return _read_compacted(path, min_duplicates)[0]
+
+def _write(df, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        df.to_csv(f, index=False, lineterminator="\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def compact(path=BODY_COMP_FILE, min_duplicates=COMPACT_MIN_DUPLICATES):
+    # Reescritura atómica solo si compensa; devuelve las líneas eliminadas
+    with _lock:
+        return _read_compacted(path, min_duplicates)[1]
+
+def replace_all(df, path=BODY_COMP_FILE):
+    # Restauración completa (p.ej. desde la copia en Google Sheets)
+    with _lock:
+        _write(dedupe(df.reindex(columns=BODY_COMP_COLUMNS)), path)
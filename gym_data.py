@@ -0,0 +1,287 @@
+# Transformaciones puras de pandas sobre el log de entrenamiento.
+# No dependen de Streamlit ni de Google Sheets: gym_app.py las cachea.
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+KG_TO_LBS = 2.20462
+# ID_Set: id único que el journal asigna a cada set (las filas anteriores lo tienen vacío)
+LOG_COLUMNS = ['Fecha', 'ID_Sesion', 'Rutina', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps', 'Notas', 'ID_Set']
+# Esquema canónico en memoria del log: texto repetitivo como categorías y numéricos estrechos
+LOG_CATEGORIES = ['ID_Sesion', 'Rutina', 'Ejercicio', 'Unidad', 'Notas']
+LOG_NUMERIC_DTYPES = {'Set_No': 'int16', 'Peso': 'float32', 'Reps': 'int16'}
+SHEET_DATE_FORMAT = '%Y-%m-%d %H:%M'
+SESSION_SUMMARY_COLUMNS = ['ID_Sesion', 'Fecha', 'Rutina', 'Sets', 'Volumen_Kg', 'Volumen_Lbs']
+
+def normalize_logs(df):
+    # Post-proceso de una hoja de logs recién leída: descarta filas vacías, mapea los
+    # esquemas antiguos al actual y aplica el esquema tipado
+    df = df.dropna(how="all")
+    if df.empty:
+        return df
+    return apply_log_schema(map_legacy_columns(df))
+
+def map_legacy_columns(df):
+    # Esquemas antiguos (Rutina_Nombre, Notes, columnas ausentes) -> columnas actuales.
+    # Sirve también para las filas en texto de una reescritura
+    if 'Rutina' not in df.columns and 'Rutina_Nombre' in df.columns:
+        df = df.rename(columns={'Rutina_Nombre': 'Rutina'})
+    elif 'Rutina' not in df.columns:
+        df['Rutina'] = 'Legacy'
+        
+    if 'Set_No' not in df.columns:
+        df['Set_No'] = 1
+        
+    if 'ID_Sesion' not in df.columns:
+        df['ID_Sesion'] = 'N/A'
+    if 'Unidad' not in df.columns:
+        df['Unidad'] = 'Kg'
+    if 'Notes' in df.columns:
+        df = df.rename(columns={'Notes': 'Notas'})
+    return df
+
+def _text_categorical(serie):
+    # Categoría de texto: Sheets puede devolver IDs numéricos (20250101103000 o 2.0250101103e13)
+    # mezclados con texto; se normalizan sobre los valores únicos, no fila a fila
+    codes, uniques = pd.factorize(serie, use_na_sentinel=True)
+    textos = np.array([str(int(u)) if isinstance(u, float) and u.is_integer() else str(u) for u in uniques], dtype=object)
+    categorias, inverse = np.unique(textos, return_inverse=True)
+    codes = np.where(codes >= 0, inverse[codes] if len(inverse) else codes, -1)
+    return pd.Categorical.from_codes(codes, categories=pd.Index(categorias, dtype=str))
+
+def parse_dates(fechas):
+    # ISO ("2025-01-01 10:00" / "2025-01-01") en una pasada; el resto, formato mixto con el
+    # día primero, como las escribe Sheets en español ("03/10/2025" es el 3 de octubre)
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas
+    parsed = pd.to_datetime(fechas, format='ISO8601', errors='coerce')
+    fallidas = parsed.isna() & fechas.notna()
+    if fallidas.any():
+        parsed[fallidas] = pd.to_datetime(fechas[fallidas].astype(str), format='mixed', dayfirst=True, errors='coerce')
+    return parsed
+
+def apply_log_schema(df):
+    # Frame canónico: Fecha datetime64, texto categórico, Set_No/Reps int16 y Peso float32.
+    # Se aplica una vez por carga (por partición); el resto del código no vuelve a convertir.
+    df = df.reindex(columns=LOG_COLUMNS + [c for c in df.columns if c not in LOG_COLUMNS])
+    columnas = {'Fecha': parse_dates(df['Fecha'])}
+    for col in LOG_CATEGORIES:
+        columnas[col] = _text_categorical(df[col])
+    for col, dtype in LOG_NUMERIC_DTYPES.items():
+        columnas[col] = pd.to_numeric(df[col], errors='coerce')
+        if dtype.startswith('int'):
+            columnas[col] = columnas[col].fillna(0)
+        columnas[col] = columnas[col].astype(dtype)
+    return df.assign(**columnas).reset_index(drop=True)
+
+def empty_logs():
+    return apply_log_schema(pd.DataFrame(columns=LOG_COLUMNS))
+
+def concat_logs(frames):
+    # pd.concat degrada a object las categóricas con categorías distintas: se unifican antes
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return empty_logs()
+    if len(frames) == 1:
+        return frames[0]
+    for col in LOG_CATEGORIES:
+        categorias = union_categoricals([f[col] for f in frames], ignore_order=True).categories
+        frames = [f.assign(**{col: f[col].cat.set_categories(categorias)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+def tombstoned(df, borrados):
+    # borrados: {ID_Sesion: Timestamp del borrado}. Máscara de las filas de esas sesiones
+    # registradas hasta el borrado; un set posterior que reutilice el ID sigue visible
+    if not borrados or df.empty:
+        return pd.Series(False, index=df.index)
+    ids = df['ID_Sesion'].cat
+    por_categoria = pd.to_datetime(pd.Series(ids.categories, dtype=object).map(borrados)).to_numpy()
+    limite = pd.Series(np.where(ids.codes >= 0, por_categoria[ids.codes], np.datetime64('NaT')), index=df.index)
+    return limite.notna() & (df['Fecha'].isna() | (df['Fecha'] <= limite))
+
+def drop_tombstoned(df, borrados):
+    ocultas = tombstoned(df, borrados)
+    if not ocultas.any():
+        return df
+    return df[~ocultas].reset_index(drop=True)
+
+def to_sheet_frame(df):
+    # Inverso de apply_log_schema para exportar o mostrar: fechas como texto, categorías
+    # como texto y Peso sin el ruido de float32 (72.3 y no 72.30000305). Las reescrituras
+    # de Logs no lo usan: escriben las celdas tal como se leyeron (read_sheet_rows)
+    columnas = {}
+    for col in df.columns:
+        serie = df[col]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            columnas[col] = serie.dt.strftime(SHEET_DATE_FORMAT).fillna('')
+        elif isinstance(serie.dtype, pd.CategoricalDtype):
+            columnas[col] = serie.astype(object).where(serie.notna(), '')
+        elif serie.dtype == 'float32':
+            columnas[col] = serie.astype('float64').round(3)
+    return df.assign(**columnas) if columnas else df
+
+def rows_not_in(df, existentes, columns):
+    # Filas de df que faltan en 'existentes' comparando 'columns' como multiconjunto: de cada
+    # clave se descartan tantas copias como ya haya, así que las filas repetidas de df
+    # (p.ej. dos sets idénticos) se conservan mientras no estén todas en 'existentes'
+    if df.empty or existentes.empty:
+        return df
+    claves = df[columns].astype(str)
+    ocurrencia = claves.groupby(columns, sort=False).cumcount().to_numpy()
+    presentes = existentes[columns].astype(str).value_counts()
+    ya = presentes.reindex(pd.MultiIndex.from_frame(claves)).fillna(0).to_numpy()
+    return df[ocurrencia >= ya]
+
+def convert_weight(weight, from_unit, to_unit):
+    if from_unit == to_unit:
+        return weight
+    if from_unit == "Kg" and to_unit == "Lbs":
+        return weight * KG_TO_LBS
+    if from_unit == "Lbs" and to_unit == "Kg":
+        return weight / KG_TO_LBS
+    return weight
+
+def normalized_weight(df, to_unit):
+    # Versión vectorizada de convert_weight por columnas: unidades desconocidas no se convierten
+    # float64 para acumular volúmenes; el redondeo quita el ruido de Peso en float32
+    peso = pd.to_numeric(df['Peso'], errors='coerce').astype('float64').round(3).fillna(0.0)
+    if to_unit == "Lbs":
+        return peso * np.where(df['Unidad'] == "Kg", KG_TO_LBS, 1.0)
+    if to_unit == "Kg":
+        return peso * np.where(df['Unidad'] == "Lbs", 1 / KG_TO_LBS, 1.0)
+    return peso
+
+def set_volume(df, to_unit):
+    # Tonelaje por set (peso normalizado x reps)
+    reps = pd.to_numeric(df['Reps'], errors='coerce').fillna(0)
+    return normalized_weight(df, to_unit) * reps
+
+def build_last_session_index(df):
+    # {ejercicio: {"fecha": str, "legacy": bool, "sets": [...]}} con la última sesión
+    # de cada ejercicio; los logs Legacy sin ID_Sesion guardan sus 3 registros más recientes.
+    if df.empty:
+        return {}
+    df = df[['Fecha', 'ID_Sesion', 'Ejercicio', 'Set_No', 'Peso', 'Unidad', 'Reps']].copy()
+    df['Peso'] = df['Peso'].astype('float64').round(3)
+    df = df.sort_values(by='Fecha', ascending=False, kind='stable')
+
+    ultimas = df.drop_duplicates(subset='Ejercicio')[['Ejercicio', 'ID_Sesion']]
+    ultimas = ultimas.rename(columns={'ID_Sesion': 'ID_Ultima'})
+    df = df.merge(ultimas, on='Ejercicio', how='left')
+    con_sesion = df['ID_Ultima'].notna() & (df['ID_Ultima'] != 'N/A')
+
+    df_sesion = df[con_sesion & (df['ID_Sesion'] == df['ID_Ultima'])].sort_values(by='Fecha', kind='stable')
+    df_legacy = df[~con_sesion].groupby('Ejercicio', sort=False, observed=True).head(3)
+
+    index = {}
+    for legacy, df_sel in ((False, df_sesion), (True, df_legacy)):
+        df_sel = df_sel.assign(Dia=df_sel['Fecha'].dt.strftime('%Y-%m-%d'))
+        for ejercicio, group in df_sel.groupby('Ejercicio', sort=False, observed=True):
+            index[ejercicio] = {
+                "fecha": group['Dia'].iloc[0],
+                "legacy": legacy,
+                "sets": group[['Dia', 'Set_No', 'Peso', 'Unidad', 'Reps']].to_dict('records'),
+            }
+    return index
+
+def build_muscle_group_index(catalog):
+    # Índice inverso {ejercicio: grupo}; si un ejercicio está en varios grupos gana el primero
+    index = {}
+    for grupo, ejercicios in catalog.items():
+        for ejercicio in ejercicios:
+            index.setdefault(ejercicio, grupo)
+    return index
+
+def map_muscle_groups(ejercicios, index):
+    # Lookup vectorizado; los ejercicios fuera del catálogo van a "Otros"
+    categorias = list(dict.fromkeys(list(index.values()) + ["Otros"]))
+    return pd.Categorical(ejercicios.map(index).fillna("Otros"), categories=categorias)
+
+def summarize_sessions(df):
+    # Una fila por sesión (sin los logs sueltos 'N/A'), ordenada de la más reciente a la más antigua
+    df = df[df['ID_Sesion'] != 'N/A']
+    if df.empty:
+        return pd.DataFrame(columns=SESSION_SUMMARY_COLUMNS).astype({'Fecha': 'datetime64[ns]'})
+    work = pd.DataFrame({
+        'ID_Sesion': df['ID_Sesion'],
+        'Fecha': df['Fecha'],
+        'Rutina': df['Rutina'],
+        'Volumen_Kg': set_volume(df, "Kg"),
+        'Volumen_Lbs': set_volume(df, "Lbs"),
+    })
+    summary = work.groupby('ID_Sesion', sort=False, observed=True).agg(
+        Fecha=('Fecha', 'first'),
+        Rutina=('Rutina', 'first'),
+        Sets=('Fecha', 'size'),
+        Volumen_Kg=('Volumen_Kg', 'sum'),
+        Volumen_Lbs=('Volumen_Lbs', 'sum'),
+    ).reset_index()
+    return summary.sort_values(by='Fecha', ascending=False, kind='stable').reset_index(drop=True)
+
+def week_start(fechas):
+    # Lunes 00:00 de cada fecha; equivale a .dt.to_period('W').start_time pero vectorizado
+    fechas = fechas.dt.normalize()
+    return fechas - pd.to_timedelta(fechas.dt.dayofweek, unit='D')
+
+def _empty_rollup(keys):
+    index = pd.MultiIndex.from_arrays([[] for _ in keys], names=keys)
+    return pd.DataFrame({'Volumen_Kg': pd.Series(dtype=float), 'Volumen_Lbs': pd.Series(dtype=float)}, index=index)
+
+def rollup_sets(df, group_index):
+    # Agregados parciales de un bloque de sets: (Semana, Grupo Muscular) y (Rutina, Día)
+    if df.empty:
+        return _empty_rollup(['Semana', 'Grupo Muscular']), _empty_rollup(['Rutina', 'Día'])
+    fecha = df['Fecha']
+    base = pd.DataFrame({
+        'Semana': week_start(fecha),
+        'Día': fecha.dt.date,
+        'Rutina': df['Rutina'].astype(object),
+        'Grupo Muscular': map_muscle_groups(df['Ejercicio'], group_index),
+        'Volumen_Kg': set_volume(df, "Kg"),
+        'Volumen_Lbs': set_volume(df, "Lbs"),
+    })
+    volumenes = ['Volumen_Kg', 'Volumen_Lbs']
+    weekly = base.groupby(['Semana', 'Grupo Muscular'], observed=True)[volumenes].sum()
+    by_routine = base.groupby(['Rutina', 'Día'])[volumenes].sum()
+    return weekly, by_routine
+
+def rollups_since(weekly, by_routine, desde):
+    # Recorte de las tablas materializadas a un rango: semanas desde la que contiene
+    # 'desde' y días desde 'desde'. Cuesta lo que el número de semanas/días, no de sets
+    desde = pd.Timestamp(desde)
+    semana = week_start(pd.Series([desde])).iloc[0]
+    weekly = weekly[weekly.index.get_level_values('Semana') >= semana]
+    by_routine = by_routine[by_routine.index.get_level_values('Día') >= desde.date()]
+    return weekly, by_routine
+
+class VolumeRollups:
+    # Tablas materializadas de volumen. apply() suma solo las semanas/días tocados por
+    # los sets nuevos; rebuild() recorre todo el historial y se usa cuando el log
+    # cambió por otra vía (otro dispositivo, borrados, catálogo distinto).
+    # key: versiones de las particiones y de las lápidas con las que se calcularon
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.group_index = None
+        self.weekly, self.by_routine = rollup_sets(pd.DataFrame(), {})
+
+    def is_current(self, key, group_index):
+        return self.key is not None and self.key == key and self.group_index == group_index
+
+    def rebuild(self, df, group_index, key):
+        self.weekly, self.by_routine = rollup_sets(df, group_index)
+        self.group_index = group_index
+        self.key = key
+
+    def apply(self, new_df, key, new_key):
+        # Solo si las tablas correspondían a 'key' (los datos justo antes de añadir new_df);
+        # si no, se quedan desfasadas y el próximo lector las reconstruye
+        if self.key is None or self.key != key:
+            return
+        if not new_df.empty:
+            weekly, by_routine = rollup_sets(new_df, self.group_index)
+            self.weekly = self.weekly.add(weekly, fill_value=0).sort_index()
+            self.by_routine = self.by_routine.add(by_routine, fill_value=0).sort_index()
+        self.key = new_key
@@ -0,0 +1,112 @@
+# Journal local (write-ahead) de sets pendientes de subir a la hoja "Logs".
+# Cada set se escribe como una línea JSON con fsync antes de intentar la
+# sincronización; los sets confirmados se marcan con registros "ack".
+import json
+import os
+import threading
+import uuid
+
+JOURNAL_FILE = 'sync_journal.jsonl'
+
+_lock = threading.Lock()
+
+def _to_native(value):
+    # numpy/pandas scalars -> tipos nativos de JSON
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+def norm_key_part(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def new_set_id():
+    # ID único de cada set, generado al registrarlo; viaja en la columna ID_Set de la hoja.
+    # Ni la clave natural ni la Fecha (al minuto) sirven: dos sets "Libre" sincronizados
+    # en el mismo minuto coinciden. La "s" inicial evita que Sheets lo lea como número.
+    return "s" + uuid.uuid4().hex[:15]
+
+def _row_set_id(row):
+    ident = row.get('ID_Set')
+    return ident.strip() if isinstance(ident, str) else ''
+
+def _append_records(records, path):
+    with _lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=_to_native) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def _read_records(path):
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Línea truncada por un corte a mitad de escritura: se ignora
+                continue
+    return records
+
+def append_sets(rows, path=JOURNAL_FILE):
+    # Un set que ya trae ID_Set lo conserva; el resto recibe uno nuevo
+    records = []
+    for row in rows:
+        row = {**row, 'ID_Set': _row_set_id(row) or new_set_id()}
+        records.append({"op": "set", "id": row['ID_Set'], "row": row})
+    if records:
+        _append_records(records, path)
+    return [r["id"] for r in records]
+
+def ack(ids, path=JOURNAL_FILE):
+    if ids:
+        _append_records([{"op": "ack", "ids": list(ids)}], path)
+
+def pending_sets(path=JOURNAL_FILE):
+    # Devuelve [(id, row), ...] en orden de registro, sin duplicados ni sets confirmados
+    with _lock:
+        records = _read_records(path)
+    acked = set()
+    for record in records:
+        if record.get("op") == "ack":
+            acked.update(record.get("ids", []))
+    pending = {}
+    for record in records:
+        if record.get("op") == "set" and record["id"] not in acked:
+            # Registros anteriores a ID_Set: su id del journal pasa a la fila
+            row = record["row"]
+            pending.setdefault(record["id"], {**row, 'ID_Set': _row_set_id(row) or "s" + record["id"]})
+    return list(pending.items())
+
+def pending_count(path=JOURNAL_FILE):
+    return len(pending_sets(path))
+
+def compact(path=JOURNAL_FILE):
+    # Reescribe el journal conservando solo los sets pendientes (escritura atómica)
+    with _lock:
+        records = _read_records(path)
+        if not records:
+            return
+        acked = set()
+        for record in records:
+            if record.get("op") == "ack":
+                acked.update(record.get("ids", []))
+        keep, seen = [], set()
+        for record in records:
+            if record.get("op") == "set" and record["id"] not in acked and record["id"] not in seen:
+                seen.add(record["id"])
+                keep.append(record)
+        if not keep:
+            os.remove(path)
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in keep:
+                f.write(json.dumps(record, ensure_ascii=False, default=_to_native) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
@@ -0,0 +1,69 @@
+# Espejo local (SQLite) de las hojas de Google Sheets. Sheets sigue siendo la
+# fuente de verdad: aquí solo se guarda la última copia leída y cuántas filas
+# de la hoja cubre, para que las lecturas posteriores pidan solo las filas nuevas.
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+MIRROR_FILE = 'gym_mirror.sqlite'
+
+_lock = threading.Lock()
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=30)
+    db.execute("CREATE TABLE IF NOT EXISTS _mirror_meta (hoja TEXT PRIMARY KEY, filas INTEGER, cabecera TEXT, synced_at REAL, version TEXT)")
+    # Espejos creados antes de que existiera la columna 'version'
+    if "version" not in {r[1] for r in db.execute("PRAGMA table_info(_mirror_meta)")}:
+        db.execute("ALTER TABLE _mirror_meta ADD COLUMN version TEXT")
+    return closing(db)
+
+def parse_rows(header, rows):
+    # Mismo parser que usa gspread_dataframe (TextParser) para conservar los tipos de conn.read
+    width = len(header)
+    rows = [(list(r) + [''] * width)[:width] for r in rows]
+    if not rows:
+        return pd.DataFrame(columns=header)
+    return TextParser([header] + rows, header=0).read()
+
+def get_meta(hoja, path=MIRROR_FILE):
+    with _connect(path) as db:
+        row = db.execute("SELECT filas, cabecera, synced_at, version FROM _mirror_meta WHERE hoja = ?", (hoja,)).fetchone()
+    if row is None:
+        return None
+    version = tuple(json.loads(row[3])) if row[3] else None
+    return {"filas": row[0], "cabecera": json.loads(row[1]), "synced_at": row[2], "version": version}
+
+def list_tables(path=MIRROR_FILE):
+    with _connect(path) as db:
+        return [row[0] for row in db.execute("SELECT hoja FROM _mirror_meta")]
+
+def read_table(hoja, path=MIRROR_FILE):
+    with _connect(path) as db:
+        return pd.read_sql_query(f'SELECT * FROM "{hoja}" ORDER BY rowid', db)
+
+def replace_table(hoja, df, header, filas, version=None, path=MIRROR_FILE):
+    # Refresco completo: 'filas' es el número de filas de datos de la hoja (vacías incluidas)
+    with _lock, _connect(path) as db:
+        df.to_sql(hoja, db, if_exists='replace', index=False)
+        db.execute("INSERT OR REPLACE INTO _mirror_meta (hoja, filas, cabecera, synced_at, version) VALUES (?, ?, ?, ?, ?)",
+                   (hoja, filas, json.dumps(header), time.time(), json.dumps(version) if version else None))
+        db.commit()
+
+def append_table(hoja, df, filas_nuevas, version=None, path=MIRROR_FILE):
+    with _lock, _connect(path) as db:
+        if not df.empty:
+            df.to_sql(hoja, db, if_exists='append', index=False)
+        db.execute("UPDATE _mirror_meta SET filas = filas + ?, version = ? WHERE hoja = ?",
+                   (filas_nuevas, json.dumps(version) if version else None, hoja))
+        db.commit()
+
+def invalidate(hoja, path=MIRROR_FILE):
+    # La próxima lectura hará un refresco completo (tras reescrituras o borrados)
+    with _lock, _connect(path) as db:
+        db.execute("DELETE FROM _mirror_meta WHERE hoja = ?", (hoja,))
+        db.commit()
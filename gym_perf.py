@@ -0,0 +1,182 @@
+# Instrumentación por rerun: spans con tiempo para las llamadas a Sheets, los aciertos y
+# fallos de las cachés, cada vista y cada gráfico. El rerun terminado se añade como una
+# línea a un JSONL para analizarlo offline y, opcionalmente, los acumulados del servidor
+# se vuelcan en formato texto de Prometheus (textfile collector).
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# Ruta vacía desactiva el fichero correspondiente
+PERF_LOG_FILE = os.environ.get("GYM_PERF_LOG", "perf_log.jsonl")
+PERF_LOG_MAX_BYTES = 5 * 2**20
+PROMETHEUS_FILE = os.environ.get("GYM_PERF_PROMETHEUS", "")
+MAX_SPANS_PER_RUN = 500
+
+# Rerun en curso del hilo actual (cada rerun de Streamlit corre en su propio hilo);
+# los spans fuera de un rerun (p.ej. el worker de sincronización) solo suman a los totales
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {}
+
+class Run:
+    def __init__(self, session, previous=None):
+        self.session = session
+        self.previous = previous  # registro del rerun anterior de la sesión (para el panel)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.stack = []
+        self.phase = None
+        self.record = None
+        self.last_activity = self.start
+
+def start_run(session, previous_run=None):
+    # Un st.rerun()/st.stop() corta el script antes de finish_run(): ese rerun se cierra
+    # al empezar el siguiente, marcado como interrumpido
+    previous = None
+    if previous_run is not None:
+        previous = previous_run.record or finish_run(previous_run, interrupted=True)
+    run = Run(session, previous)
+    _local.run = run
+    return run
+
+def current_run():
+    return getattr(_local, "run", None)
+
+def _accumulate(registro):
+    key = (registro["nombre"], registro.get("cache", ""))
+    with _lock:
+        total = _totals.setdefault(key, [0, 0.0])
+        total[0] += 1
+        total[1] += registro["ms"] / 1000
+
+def _open(run, name, tags):
+    registro = {"nombre": name, **tags, "_start": time.perf_counter()}
+    if run is not None:
+        registro["inicio_ms"] = round((registro["_start"] - run.start) * 1000, 2)
+        registro["nivel"] = len(run.stack)
+        run.stack.append(registro)
+    return registro
+
+def _close(run, registro, end=None):
+    end = time.perf_counter() if end is None else end
+    registro["ms"] = round((end - registro.pop("_start")) * 1000, 2)
+    if run is not None:
+        run.stack = [r for r in run.stack if r is not registro]
+        run.last_activity = end
+        if len(run.spans) < MAX_SPANS_PER_RUN:
+            run.spans.append(registro)
+    _accumulate(registro)
+
+@contextlib.contextmanager
+def span(name, **tags):
+    run = current_run()
+    registro = _open(run, name, tags)
+    try:
+        yield registro
+    except Exception as e:
+        registro["error"] = type(e).__name__
+        raise
+    finally:
+        _close(run, registro)
+
+def annotate(**tags):
+    # Añade etiquetas al span abierto más interno del rerun actual
+    run = current_run()
+    if run is not None and run.stack:
+        run.stack[-1].update(tags)
+
+def phase(name):
+    # Tramos secuenciales del script (arranque, sidebar, vista): cierra el anterior y abre otro
+    run = current_run()
+    if run is None:
+        return
+    if run.phase is not None:
+        _close(run, run.phase)
+    run.phase = _open(run, name, {})
+
+def cached(cache_decorator):
+    # Envuelve st.cache_data/st.cache_resource: un span por llamada con cache=hit|miss
+    # (el cuerpo solo se ejecuta en un fallo)
+    def decorator(fn):
+        @functools.wraps(fn)
+        def body(*args, **kwargs):
+            annotate(cache="miss")
+            return fn(*args, **kwargs)
+        cached_fn = cache_decorator(body)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(fn.__name__, cache="hit"):
+                return cached_fn(*args, **kwargs)
+        wrapper.clear = cached_fn.clear
+        return wrapper
+    return decorator
+
+def finish_run(run, interrupted=False):
+    if run.record is not None:
+        return run.record
+    # Un rerun interrumpido termina en su última actividad registrada, no al cerrarse
+    end = run.last_activity if interrupted else time.perf_counter()
+    if run.phase is not None:
+        _close(run, run.phase, max(end, run.phase["_start"]))
+        run.phase = None
+        end = run.last_activity
+    if getattr(_local, "run", None) is run:
+        _local.run = None
+    run.record = {
+        "inicio": datetime.fromtimestamp(run.started_at).isoformat(timespec="milliseconds"),
+        "sesion": run.session,
+        "ms": round((end - run.start) * 1000, 2),
+        "interrumpido": interrupted,
+        "spans": sorted(run.spans, key=lambda s: s.get("inicio_ms", 0)),
+    }
+    try:
+        _write_jsonl(run.record)
+        if PROMETHEUS_FILE:
+            _write_atomic(PROMETHEUS_FILE, prometheus_text())
+    except OSError:
+        # La instrumentación nunca debe romper la app
+        pass
+    return run.record
+
+def _write_jsonl(record):
+    if not PERF_LOG_FILE:
+        return
+    if os.path.exists(PERF_LOG_FILE) and os.path.getsize(PERF_LOG_FILE) > PERF_LOG_MAX_BYTES:
+        os.replace(PERF_LOG_FILE, PERF_LOG_FILE + ".1")
+    with _lock, open(PERF_LOG_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def totals():
+    with _lock:
+        return {key: tuple(value) for key, value in _totals.items()}
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text():
+    lineas = [
+        "# HELP gym_span_seconds_total Tiempo acumulado por span desde el arranque del servidor.",
+        "# TYPE gym_span_seconds_total counter",
+    ]
+    datos = sorted(totals().items())
+    for (nombre, cache), (_, segundos) in datos:
+        lineas.append(f'gym_span_seconds_total{{span="{_label(nombre)}",cache="{cache}"}} {segundos:.6f}')
+    lineas += [
+        "# HELP gym_span_count_total Número de spans registrados desde el arranque del servidor.",
+        "# TYPE gym_span_count_total counter",
+    ]
+    for (nombre, cache), (cuenta, _) in datos:
+        lineas.append(f'gym_span_count_total{{span="{_label(nombre)}",cache="{cache}"}} {cuenta}')
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,164 @@
+# Capa única de acceso a Google Sheets: limita el ritmo de peticiones con un token
+# bucket ajustado a la cuota por minuto de la API, reintenta los 429/5xx con backoff
+# exponencial con jitter y lleva la cuenta de las peticiones realizadas. Los append no
+# son idempotentes: solo se reintentan si la petición seguro que no llegó a aplicarse.
+import random
+import threading
+import time
+
+import gym_perf
+
+# Cuota por defecto de la API de Sheets: 60 peticiones/minuto por usuario
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_BURST = 15
+MAX_RETRIES = 5
+BASE_DELAY_SECONDS = 1.0
+MAX_DELAY_SECONDS = 32.0
+MAX_QUEUE_WAIT_SECONDS = 60.0
+
+# Peticiones HTTP aproximadas de cada operación de streamlit_gsheets/gspread
+REQUEST_COST = {"read": 3, "update": 3, "create": 3, "worksheet": 2}
+
+class QuotaWaitTimeout(Exception):
+    pass
+
+class SheetChangedError(Exception):
+    # La hoja cambió entre la lectura y una reescritura completa (otro dispositivo escribió)
+    pass
+
+def _status_code(e):
+    response = getattr(e, "response", None)
+    return getattr(response, "status_code", None)
+
+def is_quota_error(e):
+    return _status_code(e) == 429 or "429" in str(e) or "Quota" in str(e) or "RESOURCE_EXHAUSTED" in str(e)
+
+def is_retryable(e):
+    status = _status_code(e)
+    return is_quota_error(e) or (status is not None and 500 <= status < 600)
+
+def is_connect_error(e):
+    # La conexión no llegó a establecerse: la petición no se envió
+    nombres = {c.__name__ for c in type(e).__mro__}
+    return (isinstance(e, ConnectionRefusedError) or "ConnectTimeout" in nombres
+            or "NewConnectionError" in str(e) or "NameResolutionError" in str(e))
+
+def is_retryable_append(e):
+    # Un 5xx o un timeout de lectura pueden llegar después de que Sheets añadiera las filas;
+    # reintentarlos duplicaría sets. Un 429 o un fallo de conexión no han escrito nada.
+    return is_quota_error(e) or is_connect_error(e)
+
+def is_missing_worksheet(e):
+    return "UnsupportedOperationError" in type(e).__name__ or "WorksheetNotFound" in type(e).__name__
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1, timeout=None):
+        # Bloquea hasta disponer de 'tokens'; devuelve los segundos esperados
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise QuotaWaitTimeout(f"Cola de peticiones a Sheets saturada (espera > {timeout:.0f}s)")
+            time.sleep(delay)
+            waited += delay
+
+class SheetsClient:
+    # 'connect' abre la conexión (GSheetsConnection) en el primer acceso real a Sheets
+    def __init__(self, connect, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST,
+                 max_retries=MAX_RETRIES, base_delay=BASE_DELAY_SECONDS, max_delay=MAX_DELAY_SECONDS):
+        self._connect = connect
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": {}, "requests": 0, "retries": 0, "quota_errors": 0, "errors": 0, "wait_seconds": 0.0}
+
+    @property
+    def conn(self):
+        with self._conn_lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            return self._conn
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def call(self, kind, fn, *args, cost=None, **kwargs):
+        cost = cost if cost is not None else REQUEST_COST.get(kind, 1)
+        retryable = is_retryable_append if kind == "append" else is_retryable
+        with self._stats_lock:
+            self.stats["calls"][kind] = self.stats["calls"].get(kind, 0) + 1
+        with gym_perf.span(f"sheets.{kind}", op=getattr(fn, "__name__", kind)) as registro:
+            attempt = 0
+            while True:
+                waited = self.bucket.acquire(cost, timeout=MAX_QUEUE_WAIT_SECONDS)
+                self._count("wait_seconds", waited)
+                registro["espera_ms"] = round(registro.get("espera_ms", 0) + waited * 1000, 2)
+                self._count("requests", cost)
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if is_quota_error(e):
+                        self._count("quota_errors")
+                    if not retryable(e) or attempt >= self.max_retries:
+                        self._count("errors")
+                        raise
+                    # Backoff exponencial con "full jitter"
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                    attempt += 1
+                    registro["reintentos"] = attempt
+                    self._count("retries")
+                    self._count("wait_seconds", delay)
+                    time.sleep(delay)
+
+    def read(self, worksheet, **kwargs):
+        # ttl=0: la caché propia de conn.read no se invalida con nuestros .clear()
+        return self.call("read", self.conn.read, worksheet=worksheet, ttl=0, **kwargs)
+
+    def update(self, worksheet, data):
+        return self.call("update", self.conn.update, worksheet=worksheet, data=data)
+
+    def create(self, worksheet, data):
+        return self.call("create", self.conn.create, worksheet=worksheet, data=data)
+
+    def worksheet(self, worksheet):
+        # Worksheet de gspread (solo cuenta de servicio); None si el cliente no lo permite
+        select_worksheet = getattr(self.conn.client, "_select_worksheet", None)
+        if select_worksheet is None:
+            return None
+        return self.call("worksheet", select_worksheet, worksheet=worksheet)
+
+    def worksheet_titles(self):
+        # Títulos de todas las hojas del documento; None si el cliente no puede listarlas
+        open_spreadsheet = getattr(self.conn.client, "_open_spreadsheet", None)
+        if open_spreadsheet is None:
+            return None
+        spreadsheet = self.call("worksheet", open_spreadsheet)
+        return [ws.title for ws in self.call("read", spreadsheet.worksheets, cost=1)]
+
+    def snapshot(self):
+        with self._stats_lock:
+            return {**self.stats, "calls": dict(self.stats["calls"])}